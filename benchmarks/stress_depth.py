@@ -0,0 +1,63 @@
+# stress benchmark for deeply nested programs. every workload nests parentheses
+# depth levels deep and is run through the whole interpreter, timing each phase.
+# the evaluator walks the tree with explicit stacks, so it must not hit the
+# recursion limit however deep the nesting is. Tree.toString is left out, its
+# output grows with the square of the depth.
+#
+#   python -m benchmarks.stress_depth [depth]
+import sys
+import time
+from collections.abc import Callable
+from src.Interpreter import SPEC, buildTree
+from src.Lexer import Lexer
+
+
+# the workloads, each one a function of the depth that returns the program
+WORKLOADS: dict[str, Callable[[int], str]] = {
+    "lists": lambda depth: "( " * depth + "1 2" + " )" * depth,
+    "sum": lambda depth: "(+ " + "( " * depth + "1 2" + " )" * depth + " )",
+    "append": lambda depth: "(++ ( " + "( " * depth + "1 2" + " )" * depth + " ) )",
+    "lambda": lambda depth: "((lambda x: " + "( " * depth + "x" + " )" * depth + ") 5)",
+    "appends": lambda depth: "(++ ( " + "(1 ( 2 )) " * depth + ") )",
+    "sums": lambda depth: "(+ ( 1 " * depth + "2" + " ) )" * depth,
+    "lambdas": lambda depth: "((lambda x: " * depth + "x" + ") 5)" * depth,
+}
+
+
+# runs a program and returns the time of each phase, in seconds
+def run(lexer: Lexer, program: str) -> dict[str, float]:
+    times = {}
+    start = time.perf_counter()
+    tokens = lexer.lexTokens(program)
+    times["lex"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree = buildTree(tokens)
+    times["buildTree"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    root = tree.solveLambda(tree.root)
+    times["solveLambda"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    root = tree.solveSumAndAppend(root)
+    times["solveSumAndAppend"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree.getResult(root)
+    times["getResult"] = time.perf_counter() - start
+    return times
+
+
+def main() -> None:
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    lexer = Lexer(SPEC)
+    print(f"depth {depth}, recursion limit {sys.getrecursionlimit()}")
+    for name, workload in WORKLOADS.items():
+        times = run(lexer, workload(depth))
+        phases = "  ".join(f"{phase} {seconds:.3f}s" for phase, seconds in times.items())
+        print(f"{name:8} total {sum(times.values()):.3f}s  {phases}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# benchmark suite. every workload is generated from a size and run through
+# each phase of the interpreter, which is timed on its own (the best of a few
+# repeats). the results can be saved as json and compared with a baseline,
+# a phase slower than the baseline by more than the threshold being reported
+# as a regression (and making the suite exit with 1).
+#
+#   python -m benchmarks.suite [--scale S] [--repeat R] [--save results.json]
+#                              [--baseline baseline.json] [--threshold 0.3]
+import argparse
+import json
+import platform
+import sys
+import time
+from collections.abc import Callable
+from src.Interpreter import SPEC
+from src.Lexer import Lexer
+from .stress_depth import run
+
+# number literals are kept under the digits python converts from a string
+MAX_DIGITS = 4000
+
+
+# a big lexer spec: the spec of the interpreter and size keywords
+def bigSpec(size: int) -> list[tuple[str, str]]:
+    return [(f"KEYWORD_{i}", f"k{i}w") for i in range(size)] + SPEC
+
+
+# a sum of number literals with size digits in all
+def numbers(size: int) -> str:
+    digits = min(size, MAX_DIGITS)
+    count = max(1, size // digits)
+    return "(+ ( " + " ".join(str(i % 10) + "9" * (digits - 1) for i in range(1, count + 1)) + " ) )"
+
+
+# the programs, each one a function of its size
+WORKLOADS: dict[str, Callable[[int], str]] = {
+    "flat": lambda size: "( " + "1 " * size + ")",
+    "deep": lambda size: "( " * size + "1 2" + " )" * size,
+    "appends": lambda size: "(++ ( " + "(1 2) " * size + ") )",
+    "sums": lambda size: "(+ ( " + "1 " * size + ") )",
+    "lambdas": lambda size: "((lambda x: " * size + "x" + ") 5)" * size,
+    "numbers": lambda size: numbers(size * 10),
+}
+
+# the lexer specs, each one a function of its size
+SPECS: dict[str, Callable[[int], list[tuple[str, str]]]] = {
+    "spec": lambda size: SPEC,
+    "bigSpec": lambda size: bigSpec(size // 100),
+}
+
+
+# the best time of each phase over the repeats
+def best(times: list[dict[str, float]]) -> dict[str, float]:
+    return {phase: min(repeat[phase] for repeat in times) for phase in times[0]}
+
+
+def timeLexer(spec: list[tuple[str, str]]) -> dict[str, float]:
+    start = time.perf_counter()
+    Lexer(spec)
+    return {"lexerConstruction": time.perf_counter() - start}
+
+
+# runs every workload and spec and returns the results, workload -> phase -> seconds
+def runSuite(scale: float = 1.0, repeat: int = 5) -> dict[str, dict[str, float]]:
+    size = max(1, int(10 ** 4 * scale))
+    results = {}
+    for name, spec in SPECS.items():
+        results[name] = best([timeLexer(spec(size)) for _ in range(repeat)])
+    lexer = Lexer(SPEC)
+    for name, workload in WORKLOADS.items():
+        program = workload(size)
+        results[name] = best([run(lexer, program) for _ in range(repeat)])
+    return results
+
+
+# returns the phases slower than in the baseline by more than threshold, as
+# (workload, phase, baseline seconds, seconds). phases that take less than
+# a millisecond are left out, their times are mostly noise
+def compare(results: dict, baseline: dict, threshold: float) -> list[tuple[str, str, float, float]]:
+    regressions = []
+    for name, phases in results.items():
+        for phase, seconds in phases.items():
+            before = baseline.get(name, {}).get(phase)
+            if before is None or max(before, seconds) < 1e-3:
+                continue
+            if seconds > before * (1 + threshold):
+                regressions.append((name, phase, before, seconds))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the size of the workloads (10^4)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each workload, the best one is kept")
+    parser.add_argument("--save", help="file the results are saved to, as json")
+    parser.add_argument("--baseline", help="json results the new ones are compared with")
+    parser.add_argument("--threshold", type=float, default=0.3, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = runSuite(args.scale, args.repeat)
+    for name, phases in results.items():
+        print(f"{name:10} " + "  ".join(f"{phase} {seconds:.4f}s" for phase, seconds in phases.items()))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"python": platform.python_version(), "scale": args.scale, "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("scale", 1.0) != args.scale:
+            print(f"warning: the baseline was run with scale {baseline.get('scale')}", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.threshold)
+        for name, phase, before, seconds in regressions:
+            print(f"regression: {name} {phase} {before:.4f}s -> {seconds:.4f}s ({seconds / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
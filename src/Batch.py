@@ -0,0 +1,91 @@
+import io
+import multiprocessing
+import os
+import sys
+from collections.abc import Iterable
+from typing import TextIO
+from .Interpreter import interpret
+from .Lexer import Lexer
+from . import Stats
+
+
+# the lexer of a batch worker, given once when the worker starts, and
+# whether it records the stats of each program
+worker_lexer = None
+worker_stats = False
+
+
+def startWorker(lexer: Lexer, stats: bool = False) -> None:
+    global worker_lexer, worker_stats
+    worker_lexer = lexer
+    worker_stats = stats
+
+
+# evaluates a program of a batch and returns its result, or the error
+# that stopped it, and its stats (see Stats.asDict) if they are recorded
+def evaluateFile(filename: str) -> tuple[str, str | None, dict | None]:
+    buffer = io.StringIO()
+    stats = None
+    try:
+        if worker_stats:
+            with Stats.record() as stats:
+                interpret(worker_lexer, filename, buffer)
+        else:
+            interpret(worker_lexer, filename, buffer)
+    except Exception as error:
+        return "", f"{type(error).__name__}: {error}", None if stats is None else stats.asDict()
+    return buffer.getvalue(), None, None if stats is None else stats.asDict()
+
+
+# returns the files of a batch, in order. a path is a file, a directory
+# (whose files are taken in alphabetical order) or '@' followed by a
+# manifest listing one path per line
+def batchFiles(paths: Iterable[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if path.startswith('@'):
+            with open(path[1:], 'r') as manifest:
+                files.extend(batchFiles(line.strip() for line in manifest if line.strip()))
+        elif os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if os.path.isfile(os.path.join(path, name))
+            )
+        else:
+            files.append(path)
+    return files
+
+
+# evaluates the programs in paths (see batchFiles) with jobs worker processes
+# (one per cpu by default), sharing the lexer with them, and writes a line
+# 'file: result' or 'file: error: ...' for each of them, in input order.
+# returns the number of programs that failed. the stats recorded by the
+# workers are added to those of the batch
+def runBatch(lexer: Lexer, paths: Iterable[str], jobs: int | None = None, stream: TextIO = None) -> int:
+    stream = stream or sys.stdout
+    files = batchFiles(paths)
+    failed = 0
+    batch_stats = Stats.current
+    if jobs == 1:
+        startWorker(lexer, batch_stats is not None)
+        results = map(evaluateFile, files)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, initializer=startWorker, initargs=(lexer, batch_stats is not None))
+        # the programs are small, so they are sent to the workers in chunks
+        chunksize = max(1, min(64, len(files) // (4 * (jobs or os.cpu_count() or 1))))
+        results = pool.imap(evaluateFile, files, chunksize)
+    try:
+        for filename, (result, error, stats) in zip(files, results):
+            if stats is not None:
+                batch_stats.merge(stats)
+            if error is None:
+                stream.write(f"{filename}: {result}\n")
+            else:
+                failed += 1
+                stream.write(f"{filename}: error: {error}\n")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return failed
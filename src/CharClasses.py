@@ -0,0 +1,53 @@
+from bisect import bisect_right
+from collections.abc import Iterable
+
+
+class CharClasses:
+    # partition of the characters into disjoint intervals, such that every transition of an
+    # automaton reads either all the characters of an interval or none of them. an interval
+    # read by some transition is a class, named by its first character, and that character
+    # stands for the whole class in the alphabet. so ranges like [a-z] add one symbol per
+    # class they cover, instead of one per character
+    starts: list[int]  # first code point of each interval, sorted
+    symbols: list[str | None]  # symbol of each interval, None if no transition reads it
+
+    def __init__(self, starts: list[int], symbols: list[str | None]) -> None:
+        self.starts = starts
+        self.symbols = symbols
+
+    # builds the partition of the given intervals (first and last code point, inclusive)
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[tuple[int, int]]) -> 'CharClasses':
+        # number of intervals that start (+1) or stop (-1) at each boundary
+        changes = {}
+        for first, last in intervals:
+            if first > last:
+                continue
+            changes[first] = changes.get(first, 0) + 1
+            changes[last + 1] = changes.get(last + 1, 0) - 1
+
+        starts = []
+        symbols = []
+        covering = 0
+        for boundary in sorted(changes):
+            covering += changes[boundary]
+            starts.append(boundary)
+            symbols.append(chr(boundary) if covering else None)
+        return cls(starts, symbols)
+
+    # returns the symbol of the class of char, or None if no transition reads it
+    def symbol(self, char: str) -> str | None:
+        index = bisect_right(self.starts, ord(char)) - 1
+        if index < 0:
+            return None
+        return self.symbols[index]
+
+    # returns the symbols of the classes between first and last (inclusive)
+    def cover(self, first: int, last: int) -> list[str]:
+        index = max(bisect_right(self.starts, first) - 1, 0)
+        symbols = []
+        while index < len(self.starts) and self.starts[index] <= last:
+            if self.symbols[index] is not None:
+                symbols.append(self.symbols[index])
+            index += 1
+        return symbols
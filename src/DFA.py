@@ -1,5 +1,8 @@
-from collections.abc import Callable
-from dataclasses import dataclass
+from array import array
+from collections.abc import Callable, Iterator, Mapping
+from dataclasses import dataclass, field
+from .CharClasses import CharClasses
+from . import Stats
 
 
 @dataclass
@@ -9,22 +12,275 @@ class DFA[STATE]:
     q0: STATE
     d: dict[tuple[STATE, str], STATE]
     F: set[STATE]
+    # classes of the characters read by ranges, see NFA.classes
+    classes: CharClasses | None = None
+    # compiled form used by accept, built on the first call
+    dense: 'DenseDFA | None' = field(default=None, init=False, repr=False, compare=False)
 
     def accept(self, word: str) -> bool:
         # simulate the dfa on the given word. return true if the dfa accepts the word, false otherwise
-        state = self.q0
-        while word:
-            next_state = self.d.get((state, word[0]))
-            if next_state is None:
-                return False
-            state = next_state
-            word = word[1:]
-        return state in self.F
-    
+        if self.dense is None:
+            self.dense = self.compile()
+        return self.dense.accept(word)
+
 
     def remap_states[OTHER_STATE](self, f: Callable[[STATE], 'OTHER_STATE']) -> 'DFA[OTHER_STATE]':
         # optional, but might be useful for subset construction and the lexer to avoid state name conflicts.
         # this method generates a new dfa, with renamed state labels, while keeping the overall structure of the
         # automaton.
-        pass
+        return DFA(
+            S=set(self.S),
+            K={f(state) for state in self.K},
+            q0=f(self.q0),
+            d={(f(state), symbol): f(next_state) for (state, symbol), next_state in self.d.items()},
+            F={f(state) for state in self.F},
+            classes=self.classes,
+        )
+
+    # returns the dfa with the states numbered 0..N-1 (q0 is 0), together with the numbering
+    def number_states(self) -> tuple['DFA[int]', dict[STATE, int]]:
+        numbers = {self.q0: 0}
+        for state in self.K:
+            if state not in numbers:
+                numbers[state] = len(numbers)
+        return self.remap_states(numbers.__getitem__), numbers
+
+    # merges the equivalent states with hopcroft's algorithm. two states can only be merged
+    # if key gives the same value for both (by default, if both are final or both are not).
+    # the states of the new dfa are the sets of merged states; unreachable states are removed
+    @Stats.timed("minimize")
+    def minimize(self, key: Callable[[STATE], object] | None = None) -> 'DFA[frozenset[STATE]]':
+        if key is None:
+            key = lambda state: state in self.F
+
+        reachable = {self.q0}
+        visiting = [self.q0]
+        while visiting:
+            state = visiting.pop()
+            for symbol in self.S:
+                next_state = self.d.get((state, symbol))
+                if next_state is not None and next_state not in reachable:
+                    reachable.add(next_state)
+                    visiting.append(next_state)
+
+        # missing transitions go to an extra state, kept in a block of its own
+        dead = object()
+        inverse = {}
+        for state in reachable:
+            for symbol in self.S:
+                next_state = self.d.get((state, symbol), dead)
+                inverse.setdefault((symbol, next_state), []).append(state)
+        for symbol in self.S:
+            inverse.setdefault((symbol, dead), []).append(dead)
+
+        groups = {}
+        for state in reachable:
+            groups.setdefault(key(state), set()).add(state)
+        blocks = list(groups.values()) + [{dead}]
+        block_of = {}
+        for index, block in enumerate(blocks):
+            for state in block:
+                block_of[state] = index
+
+        # blocks used to split the others
+        splitters = set(range(len(blocks)))
+        while splitters:
+            splitter = list(blocks[splitters.pop()])
+            for symbol in self.S:
+                # states that go into the splitter on symbol, grouped by their block
+                touched = {}
+                for state in splitter:
+                    for previous in inverse.get((symbol, state), ()):
+                        touched.setdefault(block_of[previous], set()).add(previous)
+
+                for index, inside in touched.items():
+                    if len(inside) == len(blocks[index]):
+                        continue
+                    blocks[index] = blocks[index] - inside
+                    blocks.append(inside)
+                    for state in inside:
+                        block_of[state] = len(blocks) - 1
+                    # it is enough to split by the smaller half, unless the block was waiting already
+                    if index in splitters or len(inside) <= len(blocks[index]):
+                        splitters.add(len(blocks) - 1)
+                    else:
+                        splitters.add(index)
+
+        names = [frozenset(block - {dead}) for block in blocks]
+        dfa_d = {}
+        for state in reachable:
+            for symbol in self.S:
+                next_state = self.d.get((state, symbol))
+                if next_state is not None:
+                    dfa_d[names[block_of[state]], symbol] = names[block_of[next_state]]
+
+        return DFA(
+            S=set(self.S),
+            K={names[block_of[state]] for state in reachable},
+            q0=names[block_of[self.q0]],
+            d=dfa_d,
+            F={names[block_of[state]] for state in self.F if state in reachable},
+            classes=self.classes,
+        )
+
+    def compile(self) -> 'DenseDFA':
+        return DenseDFA.from_dfa(self.number_states()[0])
+
+
+class DenseDFA:
+    # dfa stored as a flat transition table. the states are 0..N-1 and the symbols are
+    # grouped in classes of symbols with the same transitions in every state, so the
+    # next state is table[state * nr_of_classes + class], -1 meaning there is no transition.
+    # transitions to states from which no final state can be reached are dropped.
+    # a character read by a range is looked up in char_classes the first time it is seen
+    # and is then kept in columns, next to the symbols of the alphabet
+    S: set[str]
+    K: range
+    q0: int
+    F: set[int]
+    classes: dict[str, int]
+    char_classes: CharClasses | None
+    columns: dict[str, int]
+    nr_of_classes: int
+    table: array
+    final: bytearray
+
+    def __init__(self, nr_of_states: int, q0: int, F: set[int], classes: dict[str, int], table: array, char_classes: CharClasses | None = None) -> None:
+        self.S = set(classes)
+        self.K = range(nr_of_states)
+        self.q0 = q0
+        self.F = set(F)
+        self.classes = classes
+        self.char_classes = char_classes
+        self.columns = dict(classes)
+        self.nr_of_classes = max(classes.values(), default=-1) + 1
+        self.table = table
+        self.final = bytearray(nr_of_states)
+        for state in self.F:
+            self.final[state] = 1
+
+    # builds the table of a dfa whose states are 0..N-1
+    @classmethod
+    def from_dfa(cls, dfa: DFA[int]) -> 'DenseDFA':
+        # states that can reach a final state
+        reverse = {}
+        for (state, _), next_state in dfa.d.items():
+            reverse.setdefault(next_state, set()).add(state)
+        live = set(dfa.F)
+        visiting = list(live)
+        while visiting:
+            for state in reverse.get(visiting.pop(), ()):
+                if state not in live:
+                    live.add(state)
+                    visiting.append(state)
+
+        # symbols with the same column of the table share a class
+        columns = {}
+        classes = {}
+        for symbol in sorted(dfa.S):
+            column = []
+            for state in range(len(dfa.K)):
+                next_state = dfa.d.get((state, symbol))
+                column.append(next_state if next_state in live else -1)
+            column = tuple(column)
+            if column not in columns:
+                columns[column] = len(columns)
+            classes[symbol] = columns[column]
+
+        table = array('i', [-1]) * (len(dfa.K) * len(columns))
+        for column, symbol_class in columns.items():
+            for state, next_state in enumerate(column):
+                table[state * len(columns) + symbol_class] = next_state
+        return cls(len(dfa.K), dfa.q0, dfa.F, classes, table, dfa.classes)
+
+    # returns the column of the table for symbol, or None if it is not in the alphabet
+    def symbol_class(self, symbol: str) -> int | None:
+        symbol_class = self.columns.get(symbol)
+        if symbol_class is None and self.char_classes is not None and len(symbol) == 1:
+            symbol_class = self.classes.get(self.char_classes.symbol(symbol))
+            if symbol_class is not None:
+                self.columns[symbol] = symbol_class
+        return symbol_class
+
+    def has_symbol(self, symbol: str) -> bool:
+        return self.symbol_class(symbol) is not None
+
+    # returns the next state, or -1 if there is no transition (or it leads to a dead state)
+    def step(self, state: int, symbol: str) -> int:
+        symbol_class = self.symbol_class(symbol)
+        if symbol_class is None:
+            return -1
+        return self.table[state * self.nr_of_classes + symbol_class]
+
+    def is_final(self, state: int) -> bool:
+        return self.final[state] == 1
+
+    # walks the dfa from word[start] until it has no transition and returns the end of the
+    # longest accepted prefix together with its final state, or (start, None) if no prefix
+    # is accepted. the last value tells if the walk reached the end of word, so a longer
+    # prefix could be accepted if more input followed
+    def walk(self, word: str, start: int) -> tuple[int, int | None, bool]:
+        columns = self.columns
+        table = self.table
+        nr_of_classes = self.nr_of_classes
+        final = self.final
+        state = self.q0
+        last_end, last_state = start, None
+        i = start
+        while i < len(word):
+            symbol_class = columns.get(word[i])
+            if symbol_class is None:
+                symbol_class = self.symbol_class(word[i])
+                if symbol_class is None:
+                    return last_end, last_state, False
+            # the table has no transitions to states that cannot reach a final state
+            state = table[state * nr_of_classes + symbol_class]
+            if state < 0:
+                return last_end, last_state, False
+            i += 1
+            if final[state]:
+                last_end, last_state = i, state
+        return last_end, last_state, True
+
+    def accept(self, word: str) -> bool:
+        table = self.table
+        nr_of_classes = self.nr_of_classes
+        state = self.q0
+        for char in word:
+            symbol_class = self.symbol_class(char)
+            if symbol_class is None:
+                return False
+            state = table[state * nr_of_classes + symbol_class]
+            if state < 0:
+                return False
+        return self.final[state] == 1
+
+    # the transitions as a read-only mapping (state, symbol) -> state, like DFA.d
+    @property
+    def d(self) -> 'Transitions':
+        return Transitions(self)
+
+
+class Transitions(Mapping):
+    # view of the transition table of a DenseDFA
+
+    def __init__(self, dfa: DenseDFA) -> None:
+        self.dfa = dfa
+
+    def __getitem__(self, key: tuple[int, str]) -> int:
+        state, symbol = key
+        next_state = -1
+        if state in self.dfa.K:
+            next_state = self.dfa.step(state, symbol)
+        if next_state < 0:
+            raise KeyError(key)
+        return next_state
+
+    def __iter__(self) -> Iterator[tuple[int, str]]:
+        for state in self.dfa.K:
+            for symbol in self.dfa.classes:
+                if self.dfa.step(state, symbol) >= 0:
+                    yield (state, symbol)
 
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
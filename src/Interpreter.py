@@ -0,0 +1,751 @@
+import io
+from array import array
+from collections.abc import Iterable, Iterator
+from typing import TextIO
+from .Lexer import Lexer, LineIndex, TokenArrays
+from . import Stats
+
+
+
+
+# the kinds of the nodes, named after the tokens they are built from
+# ('' for a lexing error) and stored in the tree as small numbers
+KINDS = ['', 'SPACE', 'L_PAR', 'R_PAR', 'LAMBDA', 'VARIABLE', 'COLON', 'APPEND', 'SUM', 'NUMBER']
+ERROR, SPACE, L_PAR, R_PAR, LAMBDA, VARIABLE, COLON, APPEND, SUM, NUMBER = range(len(KINDS))
+KIND = {name: kind for kind, name in enumerate(KINDS)}
+
+# number of pieces of the output kept before they are written
+WRITE_BATCH = 4096
+
+
+class Thunk:
+    # an argument of a function, evaluated the first time it is used.
+    # every use after that shares the same value
+    __slots__ = ('node', 'env', 'value')
+    node: int
+    env: tuple | None
+    value: int
+
+    def __init__(self, node: int, env: tuple | None):
+        self.node = node
+        self.env = env
+        self.value = -1
+
+
+# returns the argument of the lambda function a variable is bound to,
+# index being the number of lambda functions between them (see buildTree).
+# an environment is a chain of (thunk, outer environment) tuples, one for
+# each lambda function around the node evaluated, None being the empty one
+def lookup(env: tuple | None, index: int) -> Thunk | None:
+    while env is not None:
+        if index == 0:
+            return env[0]
+        index -= 1
+        env = env[1]
+    return None
+
+
+# needs of the nodes without lambda functions or variables below them
+PURE = -1
+
+
+# adds item (a number or 'NULL', for an empty list) to the items of a
+# list and returns them. the items are kept in an array of 64 bit numbers
+# while they fit in one, and are moved to a list the first time they do not
+def addItem(items: array | list, item: int | str) -> array | list:
+    if isinstance(items, array):
+        if isinstance(item, int) and -2 ** 63 <= item < 2 ** 63:
+            items.append(item)
+            return items
+        items = items.tolist()
+    items.append(item)
+    return items
+
+
+class Tree:
+    # the nodes of the trees in parallel arrays, named by their index. nodes are
+    # never freed and copies share their children (see Evaluation in the README)
+    kinds: array
+    values: list
+    first: array
+    last: array
+    next: array
+    up: array
+    starts: array
+    ends: array
+    lines: LineIndex | None
+    # the environment of each lambda function that was not applied yet
+    closures: dict[int, tuple | None]
+    # the items of each list returned by an append function, made of
+    # numbers and empty lists ('NULL'), see addItem
+    lists: dict[int, array | list]
+    # the interned nodes by their shape (see intern)
+    shapes: dict[tuple, int]
+    root: int
+
+    def __init__(self, lines: LineIndex | None = None):
+        self.kinds = array('b')
+        self.values = []
+        self.first = array('i')
+        self.last = array('i')
+        self.next = array('i')
+        self.up = array('i')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.lines = lines
+        self.closures = {}
+        self.lists = {}
+        self.shapes = {}
+        self.root = -1
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    # adds a node without children and returns it
+    def add(self, value, kind: int, start: int = -1, end: int = -1) -> int:
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.first.append(-1)
+        self.last.append(-1)
+        self.next.append(-1)
+        self.up.append(-1)
+        self.starts.append(start)
+        self.ends.append(end)
+        return len(self.kinds) - 1
+
+    # adds a node with the kind, value and children of node and returns it
+    def copy(self, node: int) -> int:
+        new_node = self.add(self.values[node], self.kinds[node], self.starts[node], self.ends[node])
+        self.first[new_node] = self.first[node]
+        self.last[new_node] = self.last[node]
+        if node in self.closures:
+            self.closures[new_node] = self.closures[node]
+        if node in self.lists:
+            self.lists[new_node] = self.lists[node]
+        return new_node
+
+    # adds child (which is not the child of another node) after the
+    # other children of node
+    def append(self, node: int, child: int) -> None:
+        if node < 0:
+            raise ValueError(f"the node has no parent to be added to{self.where(self.starts[child])}")
+        if self.last[node] < 0:
+            self.first[node] = child
+        else:
+            self.next[self.last[node]] = child
+        self.last[node] = child
+        self.up[child] = node
+
+    def children(self, node: int) -> Iterator[int]:
+        child = self.first[node]
+        while child >= 0:
+            yield child
+            child = self.next[child]
+
+    # returns where position is in the program, for an error message, or
+    # nothing if it is not known
+    def where(self, position: int) -> str:
+        if position < 0:
+            return ""
+        line, column = self.lines.locate(position) if self.lines is not None else (0, position)
+        return f" at character {column}, line {line}"
+
+    # returns the value of a number node
+    def number(self, node: int) -> int:
+        try:
+            return int(self.values[node])
+        except ValueError as error:
+            raise ValueError(f"{error}{self.where(self.starts[node])}") from None
+
+    # removes the nodes from size on, which must not be used by the others
+    def truncate(self, size: int) -> None:
+        for nodes in (self.kinds, self.values, self.first, self.last, self.next, self.up, self.starts, self.ends):
+            del nodes[size:]
+
+    # the kind and value of node followed, for each child, by the kind and
+    # value of the child if it has no children, or else by -1 and its first child
+    def shape(self, node: int) -> tuple:
+        kinds = self.kinds
+        values = self.values
+        first = self.first
+        next = self.next
+        shape = [kinds[node], values[node]]
+        child = first[node]
+        while child >= 0:
+            if first[child] < 0:
+                shape.append(kinds[child])
+                shape.append(values[child])
+            else:
+                shape.append(-1)
+                shape.append(first[child])
+            child = next[child]
+        return tuple(shape)
+
+    # interns root and the nodes below it: a node with the same shape as one
+    # interned before shares its children (and everything below them) instead
+    # of keeping its own, so the nodes with the same shape have the same first
+    # child. the brackets below root must be interned already. returns True
+    # if root itself shares the children of another node
+    def intern(self, root: int) -> bool:
+        kinds = self.kinds
+        first = self.first
+        last = self.last
+        next = self.next
+        shapes = self.shapes
+        # root and the nodes below it that are not interned, each one before
+        # the nodes below it
+        nodes = [root]
+        for node in nodes:
+            child = first[node]
+            while child >= 0:
+                if first[child] >= 0 and kinds[child] != L_PAR:
+                    nodes.append(child)
+                child = next[child]
+
+        for node in reversed(nodes):
+            other = shapes.setdefault(self.shape(node), node)
+            if other != node:
+                first[node] = first[other]
+                last[node] = last[other]
+                if node == root:
+                    return True
+        return False
+
+    # fills needs with, by their first child, the number of lambda functions
+    # around the nodes below root that the variables below them are bound to,
+    # 0 for the nodes that can be evaluated on their own and PURE for those
+    # without lambda functions or variables below them. the nodes already in
+    # needs are skipped
+    def markNeeds(self, root: int, needs: dict[int, int]) -> None:
+        kinds = self.kinds
+        values = self.values
+        first = self.first
+        next = self.next
+        # the nodes whose children are marked are pushed again as ~node
+        stack = [root] if root >= 0 else []
+        while stack:
+            node = stack.pop()
+            if node >= 0:
+                if first[node] >= 0 and first[node] not in needs:
+                    stack.append(~node)
+                    child = first[node]
+                    while child >= 0:
+                        if first[child] >= 0:
+                            stack.append(child)
+                        child = next[child]
+                continue
+
+            node = ~node
+            if first[node] in needs:
+                continue
+            value = PURE
+            child = first[node]
+            while child >= 0:
+                if first[child] >= 0:
+                    if needs[first[child]] > value:
+                        value = needs[first[child]]
+                elif kinds[child] == VARIABLE:
+                    # free variables are not bound to any lambda function
+                    if isinstance(values[child], int) and values[child] >= value:
+                        value = values[child] + 1
+                    elif value < 0:
+                        value = 0
+                elif kinds[child] == LAMBDA and value < 0:
+                    value = 0
+                child = next[child]
+            if kinds[node] == LAMBDA:
+                value = max(value - 1, 0)
+            needs[first[node]] = value
+
+    # applies all the lambda functions of the tree and returns the new tree. needs (see
+    # markNeeds) and reduced can be kept between calls while no children change
+    @Stats.timed("solveLambda")
+    def solveLambda(self, root: int, needs: dict[int, int] | None = None, reduced: dict[int, int] | None = None) -> int:
+        kinds = self.kinds
+        values = self.values
+        first = self.first
+        next = self.next
+        if needs is None:
+            needs = {}
+            self.markNeeds(root, needs)
+        if reduced is None:
+            reduced = {}
+        frames = []
+        node, env = root, None
+        value = -1
+        reductions = 0
+        reused = 0
+        while True:
+            # node is -1 once its value is known
+            if node >= 0:
+                kind = kinds[node]
+                if kind == VARIABLE:
+                    thunk = lookup(env, values[node]) if isinstance(values[node], int) else None
+                    if thunk is None:
+                        # free variables stay as they are
+                        value = self.add(values[node], kind)
+                    elif thunk.value < 0:
+                        frames.append(('force', thunk))
+                        node, env = thunk.node, thunk.env
+                        continue
+                    else:
+                        value = self.copy(thunk.value)
+                elif kind == LAMBDA:
+                    value = self.copy(node)
+                    self.closures[value] = env
+                elif first[node] < 0:
+                    value = self.add(values[node], kind)
+                elif needs.get(first[node]) == PURE:
+                    value = self.copy(node)
+                elif first[node] in reduced:
+                    value = self.copy(reduced[first[node]])
+                    reused += 1
+                else:
+                    if needs.get(first[node]) == 0:
+                        frames.append(('keep', first[node]))
+                    if next[first[node]] >= 0:
+                        # the first child is evaluated to see if it is a function
+                        frames.append(('apply', node, env))
+                    else:
+                        frames.append(('child', first[node], env, self.add(values[node], kind)))
+                    node = first[node]
+                    continue
+                node = -1
+
+            if not frames:
+                Stats.count("beta_reductions", reductions)
+                Stats.count("reused_values", reused)
+                return value
+            frame = frames.pop()
+
+            if frame[0] == 'keep':
+                # value is the value of a node that can be evaluated on its own
+                reduced[frame[1]] = value
+
+            elif frame[0] == 'force':
+                # the value is kept for the next uses, this one gets a copy
+                frame[1].value = value
+                value = self.copy(value)
+
+            elif frame[0] == 'child':
+                # value is the value of the child of the node that is evaluated
+                _, child, env, result = frame
+                self.append(result, value)
+                if next[child] >= 0:
+                    frames.append(('child', next[child], env, result))
+                    node = next[child]
+                else:
+                    value = result
+
+            elif frame[0] == 'apply':
+                # value is the value of the first child of source
+                _, source, env = frame
+                brackets = []
+                function = value
+                while kinds[function] != LAMBDA and first[function] >= 0 and next[first[function]] < 0:
+                    brackets.append(function)
+                    function = first[function]
+
+                if kinds[function] != LAMBDA:
+                    frames.append(('child', first[source], env, self.add(values[source], kinds[source])))
+                    continue
+
+                if brackets:
+                    # the bracket around the function is replaced by its result
+                    frames.append(('wrap', source, brackets[:-1]))
+                env = (Thunk(next[first[source]], env), self.closures.get(function))
+                reductions += 1
+                node = first[function]
+                if node < 0:
+                    raise IndexError(f"the lambda function has no body{self.where(self.starts[function])}")
+
+            elif frame[0] == 'wrap':
+                # value is the result of the function, which goes back
+                # in the brackets that were around it
+                _, source, brackets = frame
+                for bracket in reversed(brackets):
+                    outer = self.add(values[bracket], kinds[bracket])
+                    self.append(outer, value)
+                    value = outer
+                result = self.add(values[source], kinds[source])
+                self.append(result, value)
+                value = result
+
+    # returns the items of the list built by an append function (see
+    # addItem). the lists being concatenated are flattened, except for the
+    # empty lists inside them, which are kept as 'NULL', and the items of
+    # the lists returned by other append functions are copied at once
+    def solveAppend(self, node: int) -> array | list:
+        kinds = self.kinds
+        value = array('q')
+        stack = [(child, 1) for child in reversed(list(self.children(node)))]
+        while stack:
+            node, depth = stack.pop()
+            if node in self.lists:
+                # the result of another append function
+                items = self.lists[node]
+                if isinstance(value, array) and not isinstance(items, array):
+                    value = value.tolist()
+                value.extend(items)
+            elif kinds[node] == NUMBER:
+                value = addItem(value, self.number(node))
+            elif kinds[node] == L_PAR and self.first[node] < 0:
+                if depth != 2:
+                    value = addItem(value, 'NULL')
+            elif kinds[node] != LAMBDA:
+                stack.extend((child, depth + 1) for child in reversed(list(self.children(node))))
+
+        return value
+
+    def solveSum(self, node: int) -> int:
+        value = 0
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node in self.lists:
+                items = self.lists[node]
+                value += sum(items) if isinstance(items, array) else sum(item for item in items if item != 'NULL')
+                continue
+            if self.kinds[node] == NUMBER:
+                value += self.number(node)
+            if self.kinds[node] != LAMBDA:
+                stack.extend(self.children(node))
+        return value
+
+    # returns the value of a sum or append function. the list returned by an
+    # append function has no children, its items are written from lists
+    def solveOperation(self, node: int) -> int:
+        if self.kinds[node] == SUM:
+            return self.add(self.solveSum(node), NUMBER)
+
+        result = self.add('(', L_PAR)
+        self.lists[result] = self.solveAppend(node)
+        return result
+
+    # replaces each sum or append function with its value and returns the new tree.
+    # solved keeps the values by first child and can be kept between calls like reduced
+    @Stats.timed("solveSumAndAppend")
+    def solveSumAndAppend(self, root: int, solved: dict[int, int] | None = None) -> int:
+        kinds = self.kinds
+        first = self.first
+        if solved is None:
+            solved = {}
+        results = {}
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in results:
+                # a subtree shared by the uses of an argument
+                continue
+            if kinds[node] == LAMBDA or first[node] < 0:
+                results[node] = node
+                continue
+            if first[node] in solved:
+                results[node] = solved[first[node]]
+                continue
+            if not expanded:
+                stack.append((node, True))
+                for child in reversed(list(self.children(node))):
+                    stack.append((child, False))
+                continue
+
+            children = [results[child] for child in self.children(node)]
+            operation = -1
+            for child in children:
+                if kinds[child] == SUM or kinds[child] == APPEND:
+                    operation = child
+                    break
+
+            if operation >= 0:
+                # the node is the bracket around the function
+                results[node] = self.solveOperation(operation)
+            elif children == list(self.children(node)):
+                results[node] = node
+            else:
+                # the children are copied, they might be the children of other nodes
+                new_node = self.add(self.values[node], kinds[node])
+                for child in children:
+                    self.append(new_node, self.copy(child))
+                results[node] = new_node
+            solved[first[node]] = results[node]
+
+        result = results[root]
+        if kinds[result] == SUM or kinds[result] == APPEND:
+            # a function without brackets around it
+            result = self.solveOperation(result)
+        return result
+
+    # writes the result to stream while the tree is walked. the pieces are
+    # written a batch at a time, and the walk only keeps the open brackets,
+    # so the memory used does not depend on the size of the output
+    @Stats.timed("writeResult")
+    def writeResult(self, root: int, stream: TextIO) -> None:
+        kinds = self.kinds
+        values = self.values
+        lists = self.lists
+        first = self.first
+        next = self.next
+        pieces = []
+        # the child being written inside each open bracket
+        stack = []
+        node = root
+        while True:
+            if kinds[node] == NUMBER:
+                pieces.append(str(values[node]))
+            elif kinds[node] == L_PAR:
+                pieces.append('(')
+                if first[node] >= 0:
+                    pieces.append(' ')
+                    node = first[node]
+                    stack.append(node)
+                    continue
+                items = lists.get(node)
+                if items:
+                    pieces.append(' ')
+                    for start in range(0, len(items), WRITE_BATCH):
+                        batch = items[start : start + WRITE_BATCH]
+                        if isinstance(batch, array):
+                            pieces.append(' '.join(map(str, batch)))
+                        else:
+                            pieces.append(' '.join('()' if item == 'NULL' else str(item) for item in batch))
+                        pieces.append(' ')
+                        stream.write("".join(pieces))
+                        pieces.clear()
+                pieces.append(')')
+
+            if len(pieces) >= WRITE_BATCH:
+                stream.write("".join(pieces))
+                pieces.clear()
+
+            # node is written, go to the next child, closing the brackets
+            # whose children are all written
+            while stack:
+                child = stack.pop()
+                pieces.append(' ')
+                if next[child] >= 0:
+                    node = next[child]
+                    stack.append(node)
+                    break
+                pieces.append(')')
+            else:
+                break
+        stream.write("".join(pieces))
+
+    def getResult(self, root: int) -> str:
+        buffer = io.StringIO()
+        self.writeResult(root, buffer)
+        return buffer.getvalue()
+
+    # writes the tree below node to stream, one node per line
+    def writeTree(self, node: int, stream: TextIO, level=0) -> None:
+        values = self.values
+        first = self.first
+        next = self.next
+        pieces = []
+        # the child being written at each level below node
+        stack = []
+        while True:
+            depth = level + len(stack)
+            pieces.append("  " * depth + f"{depth}: {values[node]}\n")
+            if len(pieces) >= WRITE_BATCH:
+                stream.write("".join(pieces))
+                pieces.clear()
+
+            if first[node] >= 0:
+                node = first[node]
+                stack.append(node)
+                continue
+            while stack:
+                child = stack.pop()
+                if next[child] >= 0:
+                    node = next[child]
+                    stack.append(node)
+                    break
+            else:
+                break
+        stream.write("".join(pieces))
+
+    # returns the tree below node, one node per line
+    def toString(self, node: int, level=0) -> str:
+        buffer = io.StringIO()
+        self.writeTree(node, buffer, level)
+        return buffer.getvalue()
+
+
+# yields the lines of the file without the whitespace around them,
+# separated by spaces. if lines is given, each one is added to it
+def readContent(file, lines: LineIndex | None = None):
+    for line in file:
+        text = line.strip() + " "
+        if lines is not None:
+            lines.add(text, True, len(line) - len(line.lstrip()))
+        yield text
+
+
+# returns what readContent reads from program, joined in one string
+def readText(program: str) -> str:
+    if '\n' not in program:
+        return program.strip() + ' ' if program else ''
+    lines = program.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return ' '.join(map(str.strip, lines)) + ' ' if lines else ''
+
+
+SPEC = [
+    ("SPACE", "\\ "),
+    ("L_PAR", "("),
+    ("R_PAR", ")"),
+    ("LAMBDA", "lambda"),
+    ("VARIABLE", "[a-z]+"),
+    ("COLON", ":"),
+    ("APPEND", "++"),
+    ("SUM", "+"),
+    ("NUMBER", "[0-9]+")
+]
+
+
+# builds the tree of a program from its tokens (arrays, or an iterable of them parsed as
+# they come) under the bracket parent of tree, or as its root. see the README for the rest
+@Stats.timed("buildTree")
+def buildTree(tokens: TokenArrays | Iterable[TokenArrays], tree: Tree | None = None, parent: int = -1, owners: list[int] | None = None, intern: bool = True) -> Tree:
+    if tree is None:
+        tree = Tree()
+    blocks = iter([tokens] if isinstance(tokens, TokenArrays) else tokens)
+    values = tree.values
+    kinds = tree.kinds
+    up = tree.up
+    root = parent
+    last_node = parent
+    parsingArg = False
+    parseLambda = False
+    # the last lambda function declared with each name, -1 once it is removed
+    declared = {}
+    # the last variable bound, as (name, node it was added to, value)
+    bound = None
+    shared = 0
+    block = None
+    try:
+        for block in blocks:
+            text = block.text
+            offset = block.offset
+            # the kind of the nodes of each token code
+            kind_of = [KIND[name] for name in block.names]
+            for code, start, end in zip(block.codes, block.starts, block.ends):
+                owner = -1
+                kind = kind_of[code]
+                if kind == SPACE:
+                    if owners is not None:
+                        owners.append(-1)
+                    continue
+                if kind != R_PAR and kind != COLON:
+                    value = text[start - offset : end - offset]
+
+                if root < 0:
+                    # the root keeps its lexem whatever its kind, even ')' or ':'
+                    root = tree.add(text[start - offset : end - offset], kind, start, end)
+                    last_node = owner = root
+
+                elif kind == LAMBDA and parsingArg == False:
+                    parsingArg = True
+                    new_node = tree.add(value, kind, start, end)
+                    tree.append(last_node, new_node)
+                    last_node = owner = new_node
+
+                elif kind == VARIABLE and parsingArg:
+                    declared[value] = last_node
+                    values[last_node] += ' ' + value
+                    tree.ends[last_node] = end
+                    parsingArg = False
+                    parseLambda = True
+
+                elif kind == L_PAR or kind == APPEND or kind == SUM:
+                    new_node = tree.add(value, kind, start, end)
+                    tree.append(last_node, new_node)
+                    last_node = owner = new_node
+
+                elif kind == NUMBER or kind == VARIABLE:
+                    if kind == VARIABLE:
+                        if bound is None or bound[0] != value or bound[1] != last_node:
+                            if value not in declared:
+                                raise KeyError(f"{value}{tree.where(start)}")
+                            binder = declared[value]
+                            index = 0
+                            node = last_node
+                            while node >= 0 and node != binder:
+                                if kinds[node] == LAMBDA:
+                                    index += 1
+                                node = up[node]
+                            bound = (value, last_node, index if node >= 0 else value)
+                        value = bound[2]
+                    if kind == NUMBER and parseLambda == True:
+                        while last_node >= 0:
+                            if '(' in values[last_node]:
+                                break
+                            last_node = up[last_node]
+                    owner = tree.add(value, kind, start, end)
+                    tree.append(last_node, owner)
+
+                # go up in tree when a bracket is closed to the first
+                # bracket opened but not closed
+                elif kind == R_PAR:
+                    parseLambda = False
+                    cont = 0
+                    while last_node >= 0:
+                        if kinds[last_node] == L_PAR:
+                            cont += 1
+                            if cont == 1:
+                                owner = last_node
+                        if cont == 2:
+                            break
+                        last_node = up[last_node]
+                    if owner >= 0:
+                        tree.ends[owner] = end
+                    if intern and owner >= 0 and tree.intern(owner):
+                        shared += 1
+                        tree.truncate(owner + 1)
+                        bound = None
+                        for name, binder in declared.items():
+                            if binder > owner:
+                                declared[name] = -1
+
+                if owners is not None:
+                    owners.append(owner)
+    except (KeyError, ValueError):
+        # the errors of the program are only raised once the rest of it is
+        # lexed, a lexing error being reported instead of them
+        for block in blocks:
+            pass
+        if block.error is None:
+            raise
+
+    if block is not None and block.error is not None:
+        # lexing error, nothing is evaluated
+        root = tree.add(block.error, ERROR, block.error_position, block.error_position)
+    if parent < 0:
+        tree.root = root
+    Stats.count("shared_brackets", shared)
+    return tree
+
+
+# evaluates a program read from file and writes its result to stream
+def evaluate(lexer: Lexer, file: Iterable[str], stream: TextIO) -> None:
+    # the errors are reported at the lines and columns of the file
+    lines = LineIndex()
+    tokens = lexer.lexBlocks(readContent(file, lines), lines)
+    if Stats.current is not None:
+        # the file is lexed before the tree is built, so that the two are
+        # timed apart
+        tokens = list(tokens)
+    tree = buildTree(tokens, Tree(lines))
+    Stats.count("ast_nodes", len(tree))
+
+    root = tree.solveLambda(tree.root)
+    root = tree.solveSumAndAppend(root)
+    tree.writeResult(root, stream)
+
+
+# evaluates the program in a file and writes its result to stream
+def interpret(lexer: Lexer, filename: str, stream: TextIO) -> None:
+    with open(filename, 'r') as file:
+        evaluate(lexer, file, stream)
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from .NFA import NFA
+
+
+class LazyDFA[STATE]:
+    # dfa built from an nfa while it is used, like the subset construction but only for the
+    # states that are reached. a state is the set of nfa states, and the transitions of a
+    # state are computed the first time they are taken. at most max_states states are kept
+    # (with their transitions) in the cache; when it is full the least recently used state
+    # is evicted and is computed again if it is reached later
+    S: set[str]
+    q0: frozenset[STATE]
+    max_states: int
+    # transitions found in the cache and computed, and states evicted from it
+    transition_hits: int
+    transition_misses: int
+    evictions: int
+
+    def __init__(self, nfa: NFA[STATE], max_states: int = 1024, label: Callable[[frozenset[STATE]], object] | None = None) -> None:
+        if max_states < 1:
+            raise ValueError("the cache must hold at least one state")
+        self.nfa = nfa
+        self.S = nfa.S
+        self.q0 = nfa.epsilon_closures[nfa.q0]
+        self.max_states = max_states
+        # label of a state, kept in the cache next to its transitions
+        self.label_of = label or (lambda state: None)
+        # state -> (transitions, final, label)
+        self.cache = OrderedDict()
+        self.transition_hits = 0
+        self.transition_misses = 0
+        self.evictions = 0
+
+    # returns the cache entry of a state (its transitions, if it is final and its label),
+    # computing it on a miss
+    def entry(self, state: frozenset[STATE]) -> tuple[dict[str, frozenset[STATE]], bool, object]:
+        entry = self.cache.get(state)
+        if entry is not None:
+            self.cache.move_to_end(state)
+            return entry
+
+        if len(self.cache) >= self.max_states:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        entry = ({}, not self.nfa.F.isdisjoint(state), self.label_of(state))
+        self.cache[state] = entry
+        return entry
+
+    # returns the state reached from the state with the given transitions on symbol,
+    # computing the transition on a miss. the empty set means there is no transition.
+    # symbol is a symbol of the alphabet, see NFA.symbol_of
+    def move(self, state: frozenset[STATE], transitions: dict[str, frozenset[STATE]], symbol: str) -> frozenset[STATE]:
+        next_state = transitions.get(symbol)
+        if next_state is not None:
+            self.transition_hits += 1
+            return next_state
+
+        self.transition_misses += 1
+        next_state = set()
+        for nfa_state in state:
+            for target in self.nfa.d.get((nfa_state, symbol), ()):
+                next_state |= self.nfa.epsilon_closures[target]
+        next_state = frozenset(next_state)
+        transitions[symbol] = next_state
+        return next_state
+
+    def has_symbol(self, symbol: str) -> bool:
+        return self.nfa.symbol_of(symbol) is not None
+
+    # returns the next state, or -1 if no nfa state can be reached
+    def step(self, state: frozenset[STATE], symbol: str) -> frozenset[STATE] | int:
+        symbol = self.nfa.symbol_of(symbol)
+        if symbol is None:
+            return -1
+        next_state = self.move(state, self.entry(state)[0], symbol)
+        return next_state if next_state else -1
+
+    def is_final(self, state: frozenset[STATE]) -> bool:
+        return self.entry(state)[1]
+
+    def label(self, state: frozenset[STATE]) -> object:
+        return self.entry(state)[2]
+
+    # walks the dfa from word[start] like DenseDFA.walk
+    def walk(self, word: str, start: int) -> tuple[int, frozenset[STATE] | None, bool]:
+        state = self.q0
+        transitions = self.entry(state)[0]
+        last_end, last_state = start, None
+        i = start
+        while i < len(word):
+            symbol = self.nfa.symbol_of(word[i])
+            if symbol is None:
+                return last_end, last_state, False
+            state = self.move(state, transitions, symbol)
+            if not state:
+                return last_end, last_state, False
+            transitions, final, _ = self.entry(state)
+            i += 1
+            if final:
+                last_end, last_state = i, state
+        return last_end, last_state, True
+
+    def accept(self, word: str) -> bool:
+        state = self.q0
+        for char in word:
+            state = self.step(state, char)
+            if state == -1:
+                return False
+        return self.is_final(state)
+
+    # returns the cache counters: the states in the cache, the transitions taken that were
+    # in the cache or had to be computed, and the states evicted
+    def get_cache_stats(self) -> dict[str, int]:
+        return {
+            "states": len(self.cache),
+            "max_states": self.max_states,
+            "transition_hits": self.transition_hits,
+            "transition_misses": self.transition_misses,
+            "evictions": self.evictions,
+        }
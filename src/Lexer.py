@@ -1,104 +1,491 @@
-from .Regex import Regex, parse_regex
-from .DFA import DFA
-from .NFA import NFA
+import bisect
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from typing import TextIO
+from .Regex import parse_regex
+from .CharClasses import CharClasses
+from .DFA import DenseDFA
+from .LazyDFA import LazyDFA
+from .NFA import NFABuilder, EPSILON
+from . import Stats
+
+# number of characters read at once when lexing a file
+CHUNK_SIZE = 1 << 16
+
+# changed whenever the format of the cached lexers changes
+CACHE_VERSION = 4
+
+# modules that build the lexer. the hash of their sources is part of the name of a cache
+# file, so that lexers built by another version of them are not loaded
+COMPILER_SOURCES = ('Regex.py', 'CharClasses.py', 'NFA.py', 'DFA.py', 'LazyDFA.py', 'Lexer.py')
+
+
+# a token: its name ('' for a lexing error, whose value is the message),
+# its lexem and the positions where the lexem starts and ends in the input
+Token = tuple[str, str, int, int]
+
+
+# the tokens of a text in parallel arrays: the code of each token (the
+# index of its name in names) and the positions where its lexem starts and
+# ends in the input, text being the part of the input that starts at offset.
+# the text is only sliced when a lexem is asked for. a lexing error ends the
+# tokens, its message and position are kept apart
+class TokenArrays:
+    names: list[str]
+    text: str
+    offset: int
+    codes: array
+    starts: array
+    ends: array
+    # None if there is no lexing error
+    error: str | None
+    error_position: int
+
+    def __init__(self, names: list[str], text: str, codes: Iterable[int] = (), starts: Iterable[int] = (), ends: Iterable[int] = (), offset: int = 0) -> None:
+        self.names = names
+        self.text = text
+        self.offset = offset
+        self.codes = array('h', codes)
+        self.starts = array('q', starts)
+        self.ends = array('q', ends)
+        self.error = None
+        self.error_position = -1
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def lexem(self, index: int) -> str:
+        return self.text[self.starts[index] - self.offset : self.ends[index] - self.offset]
+
+    # yields the tokens as tuples, like lexStream
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self.codes)):
+            yield (self.names[self.codes[index]], self.lexem(index), self.starts[index], self.ends[index])
+        if self.error is not None:
+            yield ("", self.error, self.error_position, self.error_position)
+
+
+# the positions where the lines of a text start, to find the line and column
+# of a position with a binary search. the text is added in pieces as it is
+# read, a line starting after each '\n' and, if the text was not read as it
+# is (like the lines of a file without their indentation), wherever its
+# reader says, with the column of its first character
+class LineIndex:
+    starts: array
+    columns: array
+    # the length of the text added so far
+    length: int
+
+    def __init__(self) -> None:
+        self.starts = array('q')
+        self.columns = array('q')
+        self.length = 0
+
+    def add(self, text: str, newline: bool = False, column: int = 0) -> None:
+        if newline or not self.starts:
+            self.starts.append(self.length)
+            self.columns.append(column)
+        i = text.find('\n')
+        while i >= 0:
+            self.starts.append(self.length + i + 1)
+            self.columns.append(0)
+            i = text.find('\n', i + 1)
+        self.length += len(text)
+
+    # returns the line (counted from 0) and the column of position
+    def locate(self, position: int) -> tuple[int, int]:
+        if not self.starts:
+            return 0, position
+        line = max(bisect.bisect_right(self.starts, position) - 1, 0)
+        return line, position - self.starts[line] + self.columns[line]
+
+
+# yields the chunks of a text, adding them to lines
+def indexChunks(chunks: Iterable[str], lines: LineIndex) -> Iterator[str]:
+    for chunk in chunks:
+        lines.add(chunk)
+        yield chunk
+
+
+# directory with the compiled lexers, one file per spec. can be changed with
+# the LEXER_CACHE_DIR environment variable
+def getCacheDir() -> str:
+    directory = os.environ.get('LEXER_CACHE_DIR')
+    if not directory:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        directory = os.path.join(cache_home, 'language-interpreter')
+    return os.path.join(directory, f'v{CACHE_VERSION}')
+
+
+# returns the hash of the sources of the modules that build the lexer
+@lru_cache(maxsize=None)
+def getCompilerHash() -> str:
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in COMPILER_SOURCES:
+        with open(os.path.join(directory, name), 'rb') as file:
+            digest.update(name.encode() + b'\0' + file.read() + b'\0')
+    return digest.hexdigest()
+
+
+# path of the cache file of a spec, named after the hash of the spec and of the compiler
+def getCachePath(spec: list[tuple[str, str]], cache_dir: str | None = None, minimize: bool = True) -> str:
+    key = hashlib.sha256(json.dumps([[list(pair) for pair in spec], minimize, getCompilerHash()]).encode()).hexdigest()
+    return os.path.join(cache_dir or getCacheDir(), key + '.json')
+
 
 class Lexer:
-    dfa: DFA
+    dfa: DenseDFA | LazyDFA
+    lazy: bool
     tokens: [(str, set)]
+    token_table: dict[int, tuple[str, int]]
+    state_counts: dict[str, int]
+
+    # minimize: merge the equivalent states of the dfa
+    # lazy: do not build the dfa up front, its states are computed by lex when they are
+    # first reached and at most max_states of them are kept
+    @Stats.timed("Lexer.__init__")
+    def __init__(self, spec: list[tuple[str, str]], minimize: bool = True, lazy: bool = False, max_states: int = 1024) -> None:
+        with Stats.phase("thompson"):
+            builder = NFABuilder()
+            nfa_q0 = builder.new_state()
+            nfa_F = set()
+            # tokens is a list of pairs (TOKEN_NAME:FINAL_STATES), where the final states
+            # are those from the NFA represented by token's regex
+            self.tokens = []
+            # connects all nfas to the same initial state
+            for token, regex in spec:
+                start_state, accept_state = parse_regex(regex).build(builder)
+                # add token and nfa final state in tokens list
+                self.tokens.append((token, {accept_state}))
+                builder.add_transition(nfa_q0, EPSILON, start_state)
+                nfa_F.add(accept_state)
+
+            nfa = builder.build(nfa_q0, nfa_F)
+        self.lazy = lazy
+        if lazy:
+            self.token_table = {}
+            self.state_counts = {"nfa": len(nfa.K)}
+            self.dfa = LazyDFA(nfa, max_states, label=self.priorityOf)
+            self.prepareWalk()
+            return
 
-    def __init__(self, spec: list[tuple[str, str]]) -> None:
-        nfa_q0 = Regex.get_state()
-        nfa_S = set()
-        nfa_K = {nfa_q0}
-        nfa_d = {}
-        nfa_d[(nfa_q0, '')] = set()
-        nfa_F = set()
-        # tokens is a list of pairs (TOKEN_NAME:FINAL_STATES), where the final states
-        # are those from the NFA represented by token's regex
-        self.tokens = []
-        # connects all nfas to the same initial state
-        for token, regex in spec:
-            new_nfa = parse_regex(regex).thompson()
-            # add token and nfa final state in tokens list
-            self.tokens.append((token, new_nfa.F))
-            nfa_d = nfa_d.copy()
-            nfa_d.update(new_nfa.d)
-            nfa_d[(nfa_q0, '')] |= {new_nfa.q0}
-            nfa_S |= new_nfa.S
-            nfa_K |= new_nfa.K
-            nfa_F |= new_nfa.F
-
-        nfa = NFA(nfa_S, nfa_K, nfa_q0, nfa_d, nfa_F)
-        self.dfa = nfa.subset_construction()
+        dfa = nfa.subset_construction()
 
+        # each final state of the dfa is mapped to the priority (the index in spec) of the
+        # token with the highest priority whose nfa final states it contains
+        priorities = {state: self.priorityOf(state) for state in dfa.F}
+
+        self.state_counts = {"nfa": len(nfa.K), "subset_construction": len(dfa.K)}
+        if minimize:
+            # final states of different tokens are never merged
+            dfa = dfa.minimize(priorities.get)
+            priorities = {block: priorities[next(iter(block))] for block in dfa.F}
+            self.state_counts["minimized"] = len(dfa.K)
+
+        dfa, numbers = dfa.number_states()
+        self.token_table = {numbers[state]: (self.tokens[priority][0], priority) for state, priority in priorities.items()}
+        self.dfa = DenseDFA.from_dfa(dfa)
+
+        self.prepareWalk()
+
+    # returns the priority (the index in spec) of the token with the highest priority whose
+    # nfa final states are in state, or None if there is no such token
+    def priorityOf(self, state: frozenset) -> int | None:
+        for priority, (token, accept_state) in enumerate(self.tokens):
+            if not accept_state.isdisjoint(state):
+                return priority
+        return None
+
+    # computes the tables used by longestMatch from the dfa
+    def prepareWalk(self) -> None:
+        # multi-character symbols of the alphabet, mapped to their final state (None if not accepted)
+        self.symbols = {}
+        for symbol in self.dfa.S:
+            if len(symbol) > 1:
+                next_state = self.dfa.step(self.dfa.q0, symbol)
+                self.symbols[symbol] = next_state if next_state != -1 and self.dfa.is_final(next_state) else None
+
+    # writes the compiled lexer (dfa table and token table) to path
+    def save(self, path: str) -> None:
+        if self.lazy:
+            raise ValueError("a lazy lexer has no dfa table to save")
+        data = {
+            "version": CACHE_VERSION,
+            "tokens": [(token, sorted(accept_state)) for token, accept_state in self.tokens],
+            "K": len(self.dfa.K),
+            "q0": self.dfa.q0,
+            "F": sorted(self.dfa.F),
+            "classes": self.dfa.classes,
+            "char_classes": None if self.dfa.char_classes is None else [self.dfa.char_classes.starts, self.dfa.char_classes.symbols],
+            "table": self.dfa.table.tolist(),
+            "token_table": sorted((state, token, priority) for state, (token, priority) in self.token_table.items()),
+            "state_counts": self.state_counts,
+        }
+        # written to a temporary file first, so that a lexer running at the same time
+        # never reads half of the file
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(data, file, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    # reads a lexer written by save. a file whose table does not fit its states and
+    # classes is rejected with a ValueError
+    @classmethod
+    @Stats.timed("Lexer.load")
+    def load(cls, path: str) -> 'Lexer':
+        with open(path, 'r') as file:
+            data = json.load(file)
+        if data.get("version") != CACHE_VERSION:
+            raise ValueError(f"{path} was written by another version of the lexer")
+
+        lexer = cls.__new__(cls)
+        lexer.lazy = False
+        char_classes = None
+        if data["char_classes"] is not None:
+            char_classes = CharClasses(*data["char_classes"])
+        states = range(data["K"])
+        if data["q0"] not in states or not all(state in states for state in data["F"]):
+            raise ValueError(f"{path} has an initial or a final state that is not a state")
+        dfa = DenseDFA(data["K"], data["q0"], set(data["F"]), data["classes"], array('i', data["table"]), char_classes)
+        if len(dfa.table) != len(states) * dfa.nr_of_classes:
+            raise ValueError(f"{path} has a table of {len(dfa.table)} entries for {len(states)} states and {dfa.nr_of_classes} classes")
+        if dfa.table and (min(dfa.table) < -1 or max(dfa.table) >= len(states)):
+            raise ValueError(f"{path} has a transition to a state that is not a state")
+        lexer.dfa = dfa
+        lexer.tokens = [(token, set(accept_state)) for token, accept_state in data["tokens"]]
+        lexer.token_table = {state: (token, priority) for state, token, priority in data["token_table"]}
+        if not lexer.token_table.keys() <= dfa.F:
+            raise ValueError(f"{path} has a token for a state that is not final")
+        lexer.state_counts = data["state_counts"]
+        lexer.prepareWalk()
+        return lexer
+
+    # returns the lexer for spec from the cache directory, building and saving it
+    # if it is not there yet. a cache that cannot be read or written is ignored.
+    # the state counts of the lexer are recorded as the counters states.*
+    @classmethod
+    def from_cache(cls, spec: list[tuple[str, str]], cache_dir: str | None = None, minimize: bool = True) -> 'Lexer':
+        path = getCachePath(spec, cache_dir, minimize)
+        try:
+            lexer = cls.load(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            lexer = None
+
+        if lexer is None:
+            lexer = cls(spec, minimize)
+            try:
+                lexer.save(path)
+            except OSError:
+                pass
+        for name, states in lexer.getStateCounts().items():
+            Stats.count(f"states.{name}", states)
+        return lexer
+
+
+    # returns a copy of the table that maps each final state of the dfa to its (token, priority).
+    # a lazy lexer only knows the final states that are in its cache
+    def getTokenTable(self) -> dict[int | frozenset, tuple[str, int]]:
+        if self.lazy:
+            return {
+                state: (self.tokens[priority][0], priority)
+                for state, (_, final, priority) in self.dfa.cache.items() if final
+            }
+        return dict(self.token_table)
+
+    # returns the state cache counters of a lazy lexer, None for other lexers
+    def getCacheStats(self) -> dict[str, int] | None:
+        if self.lazy:
+            return self.dfa.get_cache_stats()
+        return None
+
+    # returns the number of nfa states and of dfa states after subset construction
+    # and, if the dfa was minimized, after minimization
+    def getStateCounts(self) -> dict[str, int]:
+        return dict(self.state_counts)
 
     # returns the final state if the dfa accepts the word, otherwise -1
     def finalState(self, word: str) -> int:
         state = self.dfa.q0
         if word == '++' or word == 'lambda':
-            next_state = self.dfa.d.get((state, word))
-            if next_state is None or next_state not in self.dfa.F:
+            next_state = self.dfa.step(state, word)
+            if next_state == -1 or not self.dfa.is_final(next_state):
                 return -1
             return next_state
 
-        while word:
-            next_state = self.dfa.d.get((state, word[0]))
-            if next_state is None:
+        for char in word:
+            state = self.dfa.step(state, char)
+            if state == -1:
                 return -1
-            state = next_state
-            word = word[1:]
       
-        if state not in self.dfa.F:
+        if not self.dfa.is_final(state):
             return -1
         return state
 
-    def lex(self, word: str) -> list[tuple[str, str]] | None:
-        
-        cont_newline = 0
-        last_newline = 0
+    # walks the dfa once from word[start] and returns the end of the longest accepted
+    # lexem together with its final state, or (start, None) if no prefix is accepted.
+    # the last value tells if the lexem could still grow if more input followed word
+    def longestMatch(self, word: str, start: int) -> tuple[int, int | frozenset | None, bool]:
+        if Stats.current is not None:
+            Stats.current.count("dfa_walks")
+        last_end, last_state, can_grow = self.dfa.walk(word, start)
+
+        # multi-character symbols (like '++' or 'lambda') are matched as a single
+        # transition from q0 and take precedence over the same lexem read char by char
+        for symbol, symbol_state in self.symbols.items():
+            if len(symbol) > len(word) - start:
+                # word ends with a prefix of the symbol
+                if word.startswith(symbol[: len(word) - start], start):
+                    can_grow = True
+            elif symbol_state is not None and start + len(symbol) >= last_end and word.startswith(symbol, start):
+                last_end, last_state = start + len(symbol), symbol_state
+
+        return last_end, last_state, can_grow
+
+    # returns the code of the token of the longest lexem that starts at word[start] (see
+    # TokenArrays) and the end of the lexem, or None if no prefix is accepted. word is the
+    # whole input
+    def codeAt(self, word: str, start: int) -> tuple[int, int] | None:
+        end, final_state, _ = self.longestMatch(word, start)
+        if final_state is None:
+            return None
+        if self.lazy:
+            return self.dfa.label(final_state), end
+        return self.token_table[final_state][1], end
+
+    @Stats.timed("lex")
+    def lex(self, word: str) -> list[Token] | None:
         # checks if all characters in the word are in dfa's alphabet 
         # if a character is not recognized by the lexer stops parsing the word
-        i = 0
-        while i < len(word):
-            char = word[i]
-            if char == '\n':
-                last_newline = i + 1
-                cont_newline += 1
-            if word[i : i + 6] == 'lambda' and word[i : i + 6] in self.dfa.S:
-                i += 6
-                continue
-            if char not in self.dfa.S and char.isalnum():
-                char_idx = "EOF" if i == len(word) else str(i - last_newline)
-                return [("", f"No viable alternative at character {char_idx}, line {cont_newline}")]
-            i += 1
+        if any(char.isalnum() and not self.dfa.has_symbol(char) for char in set(word)):
+            i = 0
+            while i < len(word):
+                char = word[i]
+                if word[i : i + 6] == 'lambda' and word[i : i + 6] in self.dfa.S:
+                    i += 6
+                    continue
+                if char.isalnum() and not self.dfa.has_symbol(char):
+                    lines = LineIndex()
+                    lines.add(word)
+                    line, column = lines.locate(i)
+                    return [("", f"No viable alternative at character {column}, line {line}", i, i)]
+                i += 1
+
+        result = list(self.lexStream([word]))
+        if result and result[-1][0] == "":
+            return [result[-1]]
+        return result
 
+    # returns the position and the message of the lexing error at text[i], text
+    # starting at offset in the input. at_end tells if text ends the input
+    def errorAt(self, text: str, i: int, offset: int, at_end: bool, lines: LineIndex) -> tuple[int, str]:
+        char = text[i]
+        if char.isalnum() and not self.dfa.has_symbol(char):
+            # same message as the alphabet check from lex
+            j = i
+        else:
+            j = i + 1
+        line, column = lines.locate(offset + j)
+        if at_end and j == len(text) and j > i:
+            column = "EOF"
+        return offset + j, f"No viable alternative at character {column}, line {line}"
+
+    # lexes tokens.text into tokens until its end or, if more text follows it
+    # (at_end is False), until a lexem that might continue in that text, and
+    # returns where it stopped in tokens.text. a lexing error ends the tokens
+    def lexInto(self, tokens: TokenArrays, at_end: bool, lines: LineIndex | None = None) -> int:
+        text = tokens.text
+        offset = tokens.offset
+        codes = tokens.codes
+        starts = tokens.starts
+        ends = tokens.ends
         i = 0
-        j = len(word)
-        result = []
-        while i < j:
-
-            final_state = self.finalState(word[i : j])
-            if final_state != -1:
-                for (token, accept_state) in self.tokens:
-                    # token with highest priority
-                    if list(accept_state)[0] in final_state:
-                        result.append((token, word[i : j]))
-                        break
-                i = j
-                j = len(word)
+        while i < len(text):
+            j, final_state, can_grow = self.longestMatch(text, i)
+            if not at_end and (can_grow or (final_state is None and i + 1 == len(text))):
+                break
+            if final_state is None:
+                if lines is None:
+                    lines = LineIndex()
+                    lines.add(text)
+                tokens.error_position, tokens.error = self.errorAt(text, i, offset, at_end, lines)
+                break
+            codes.append(self.dfa.label(final_state) if self.lazy else self.token_table[final_state][1])
+            starts.append(offset + i)
+            ends.append(offset + j)
+            i = j
+        Stats.count("tokens", len(codes))
+        return i
+
+    # returns the tokens of a whole text as arrays, without a string for each
+    # token. the lines of the text are those of lines if it is given
+    @Stats.timed("lex")
+    def lexTokens(self, text: str, lines: LineIndex | None = None) -> TokenArrays:
+        tokens = TokenArrays([token for token, _ in self.tokens], text)
+        self.lexInto(tokens, True, lines)
+        return tokens
+
+    # yields the tokens of the text read from a file object or from an iterable of
+    # chunks as arrays, one for about every CHUNK_SIZE characters, keeping in memory
+    # only the text being lexed and the lexem that is not finished yet, which starts
+    # the text of the next arrays. a lexing error ends the last arrays. the lines of
+    # the text are added to lines, for the position of an error; if the text is not
+    # read as it is, lines can instead be given already filled by its reader
+    def lexBlocks(self, chunks: Iterable[str] | TextIO, lines: LineIndex | None = None) -> Iterator[TokenArrays]:
+        if hasattr(chunks, 'read'):
+            file = chunks
+            chunks = iter(lambda: file.read(CHUNK_SIZE), '')
+        chunks = iter(chunks)
+        if lines is None:
+            lines = LineIndex()
+            chunks = indexChunks(chunks, lines)
+
+        names = [token for token, _ in self.tokens]
+        buffer = ''
+        # position of buffer[0] in the whole input
+        offset = 0
+        # the chunks read since the last arrays, joined once they are enough
+        parts = []
+        size = 0
+        eof = False
+        while not eof:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
             else:
-                # i == j - 1 means that no lexem can be found for any substring
-                # that starts with the character word[i]
-                if i == j - 1:
-                    last_newline = 0
-                    cont_newline = 0
-                    for k in range(0, len(word[: j])):
-                        if word[k] == '\n':
-                            last_newline = k + 1
-                            cont_newline += 1
-                    char_idx = "EOF" if j == len(word) else str(j - last_newline)
-
-                    return [("", f"No viable alternative at character {char_idx}, line {cont_newline}")]
-
-                j -= 1
-        return result
\ No newline at end of file
+                parts.append(chunk)
+                size += len(chunk)
+                # the unfinished lexem is walked again from its start, so at least as much
+                # text as it has is read first, to walk a long lexem a linear number of times
+                if size < max(CHUNK_SIZE, len(buffer)):
+                    continue
+            buffer += ''.join(parts)
+            parts = []
+            size = 0
+
+            tokens = TokenArrays(names, buffer, offset=offset)
+            with Stats.phase("lex"):
+                i = self.lexInto(tokens, eof, lines)
+            yield tokens
+            if tokens.error is not None:
+                return
+            # forget the lexems that were already lexed
+            offset += i
+            buffer = buffer[i:]
+
+    # yields the tokens of lexBlocks one by one. unlike lex, the tokens found before
+    # an error are yielded before the error itself
+    def lexStream(self, chunks: Iterable[str] | TextIO, lines: LineIndex | None = None) -> Iterator[Token]:
+        for tokens in self.lexBlocks(chunks, lines):
+            yield from tokens
@@ -1,6 +1,9 @@
 from .DFA import DFA
+from .CharClasses import CharClasses
+from . import Stats
 from dataclasses import dataclass
 from collections.abc import Callable
+from functools import cached_property
 
 EPSILON = ''  # This is how epsilon is represented by the checker in the transition function of NFAs
 
@@ -11,27 +14,90 @@ class NFA[STATE]:
     q0: STATE  # Initial state
     d: dict[tuple[STATE, str], set[STATE]]  # Transition function
     F: set[STATE]  # Set of final states
+    # Classes of the characters read by ranges, None if every symbol is a single character
+    classes: CharClasses | None = None
+
+    # returns the symbol of the alphabet that stands for char, or None if no transition reads it
+    def symbol_of(self, char: str) -> str | None:
+        if char in self.S:
+            return char
+        if self.classes is None or len(char) != 1:
+            return None
+        return self.classes.symbol(char)
 
     def epsilon_closure(self, state: STATE) -> set[STATE]:
         # Compute the epsilon closure of a state (you will need this for subset construction)
         # See the EPSILON definition at the top of this file
-        visiting = [state]
-        epsilon_set = {state}
-        while visiting:
-            first_state = visiting.pop(0)
-            for transition, nfa_states in self.d.items():
-                # Check if there is a transition to a state consuming EPSILON
-                if transition[0] == first_state and transition[1] == EPSILON:
-                    for state in nfa_states:
-                        if state not in epsilon_set:
-                            visiting.append(state)
-                            epsilon_set.add(state)
-        return epsilon_set
+        return set(self.epsilon_closures.get(state, {state}))
+
+    # The epsilon closures of all states, computed once. The epsilon transitions are indexed
+    # by state and the strongly connected components of the epsilon graph are found with
+    # Tarjan's algorithm; every component gets a single closure, shared by its states and
+    # built from the closures of the components it leads to.
+    # The closures are cached, so the NFA should not be changed after they are first used.
+    @cached_property
+    def epsilon_closures(self) -> dict[STATE, frozenset[STATE]]:
+        successors = {}
+        for (state, symbol), next_states in self.d.items():
+            if symbol == EPSILON:
+                successors.setdefault(state, set()).update(next_states)
 
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        closures = {}
+        computed = 0
+        for root in self.K | successors.keys():
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            # depth first search without recursion, each entry holds the children left to visit
+            work = [(root, iter(successors.get(root, ())))]
+            while work:
+                state, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(successors.get(child, ()))))
+                        break
+                    if child in on_stack:
+                        low[state] = min(low[state], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[state])
+                    if low[state] != index[state]:
+                        continue
+
+                    # state is the root of a component; the components it leads to are done
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == state:
+                            break
+                    closure = set(component)
+                    for member in component:
+                        for child in successors.get(member, ()):
+                            if child not in component:
+                                closure |= closures[child]
+                    closure = frozenset(closure)
+                    computed += 1
+                    for member in component:
+                        closures[member] = closure
+        Stats.count("epsilon_closures", computed)
+        return closures
+
+    @Stats.timed("subset_construction")
     def subset_construction(self) -> DFA[frozenset[STATE]]:
-        all_eps_sets = {}
-        for state in self.K:
-            all_eps_sets[state] = self.epsilon_closure(state)
+        all_eps_sets = self.epsilon_closures
 
         dfa_S = self.S
         dfa_K = set()
@@ -69,9 +135,56 @@ class NFA[STATE]:
         # Sink state consumes transitions on all symbols
         for symbol in self.S:
             dfa_d[(sink_state, symbol)] = sink_state
-        return DFA(S=dfa_S, K=dfa_K, q0=dfa_q0, d=dfa_d, F=dfa_F)
+        return DFA(S=dfa_S, K=dfa_K, q0=dfa_q0, d=dfa_d, F=dfa_F, classes=self.classes)
 
     def remap_nfa_states[OTHER_STATE](self, f: 'Callable[[STATE], OTHER_STATE]') -> 'NFA[OTHER_STATE]':
         # Optional, but may be useful for the second stage of the project. Works similarly to 'remap_nfa_states'
         # from the DFA class. See the comments there for more details.
         pass
+
+
+class NFABuilder:
+    # nfa under construction, shared by all the nodes of a regex (or all the regexes of a
+    # lexer) so that each of them only adds its own states and transitions. the states
+    # are numbered from 0, independently of other builders.
+    # transitions on ranges of characters are kept aside until the nfa is built, when the
+    # characters are split into classes and each range gets a transition per class it covers
+    S: set[str]
+    d: dict[tuple[int, str], set[int]]
+    ranges: list[tuple[int, int, int, int]]
+    nr_of_states: int
+
+    def __init__(self) -> None:
+        self.S = set()
+        self.d = {}
+        self.ranges = []
+        self.nr_of_states = 0
+
+    def new_state(self) -> int:
+        state = self.nr_of_states
+        self.nr_of_states += 1
+        return state
+
+    def add_transition(self, state: int, symbol: str, next_state: int) -> None:
+        if symbol != EPSILON:
+            self.S.add(symbol)
+        self.d.setdefault((state, symbol), set()).add(next_state)
+
+    # adds a transition on every character between first and last (inclusive)
+    def add_range(self, state: int, first: str, last: str, next_state: int) -> None:
+        if first <= last:
+            self.ranges.append((state, ord(first), ord(last), next_state))
+
+    # the builder should not be used after the nfa is built, which shares its transitions
+    def build(self, q0: int, F: set[int]) -> NFA[int]:
+        classes = None
+        if self.ranges:
+            # single characters are classes of their own
+            intervals = [(first, last) for _, first, last, _ in self.ranges]
+            intervals += [(ord(symbol), ord(symbol)) for symbol in self.S if len(symbol) == 1]
+            classes = CharClasses.from_intervals(intervals)
+            for state, first, last, next_state in self.ranges:
+                for symbol in classes.cover(first, last):
+                    self.add_transition(state, symbol, next_state)
+            self.ranges = []
+        return NFA(S=self.S, K=set(range(self.nr_of_states)), q0=q0, d=self.d, F=F, classes=classes)
@@ -1,16 +1,41 @@
-from .NFA import NFA
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from .NFA import NFA, NFABuilder, EPSILON
+
+
+class Regex(ABC):
+    # the children of the node, whose fragments are built before the node's own
+    def children(self) -> list['Regex']:
+        return []
+
+    # adds the states and transitions of the node to builder, connecting the fragments
+    # (start state, accept state) of its children, and returns the node's fragment
+    @abstractmethod
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        ...
+
+    # adds the nfa of the regex to builder and returns its (start state, accept state).
+    # the tree is walked in post-order without recursion, so deep regexes are fine
+    def build(self, builder: NFABuilder) -> tuple[int, int]:
+        results = []
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                nr_of_children = len(node.children())
+                parts = results[len(results) - nr_of_children :]
+                del results[len(results) - nr_of_children :]
+                results.append(node.fragment(builder, parts))
+            else:
+                stack.append((node, True))
+                for child in reversed(node.children()):
+                    stack.append((child, False))
+        return results[0]
 
-
-class Regex:
-    nr_of_states = 0
-
-    def get_state() -> int:
-        state = Regex.nr_of_states
-        Regex.nr_of_states += 1
-        return state
-    
     def thompson(self) -> NFA[int]:
-        return self.thompson()
+        builder = NFABuilder()
+        start_state, accept_state = self.build(builder)
+        return builder.build(start_state, {accept_state})
 
 
 class Character(Regex):
@@ -19,19 +44,13 @@ class Character(Regex):
     def __init__(self, char: str):
         self.char = char
 
-    def thompson(self) -> NFA[int]:
-            start_state = Regex.get_state()
-            accept_state = Regex.get_state()
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
-            # Initialize NFA parameters
-            nfa_S = {self.char}
-            nfa_K = {start_state, accept_state}
-            nfa_q0 = start_state
-            nfa_d = {(start_state, self.char): {accept_state}}  # Transition on the character
-            nfa_F = {accept_state}
-            
-            # Create a simple NFA for a single character
-            return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
+        # Transition on the character
+        builder.add_transition(start_state, self.char, accept_state)
+        return start_state, accept_state
 
 
 class Concat(Regex):
@@ -42,26 +61,17 @@ class Concat(Regex):
         self.left = left
         self.right = right
 
-    def thompson(self) -> NFA[int]:
-        # Will combine two NFAs for concatenation
-        left_nfa = self.left.thompson()
-        right_nfa = self.right.thompson()
+    def children(self) -> list[Regex]:
+        return [self.left, self.right]
 
-        nfa_S = left_nfa.S | right_nfa.S
-        nfa_K = left_nfa.K | right_nfa.K
-        nfa_q0 = left_nfa.q0
-        nfa_F = right_nfa.F
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        (left_start, left_accept), (right_start, right_accept) = parts
 
-        # Combine the transitions
-        nfa_d = left_nfa.d.copy()
-        nfa_d.update(right_nfa.d)
+        # Connect left NFA's accept state to right NFA's start state with an epsilon transition
+        builder.add_transition(left_accept, EPSILON, right_start)
+        return left_start, right_accept
 
-        # Connect left NFA's accept states to right NFA's start state with epsilon transitions
-        for left_accept in left_nfa.F:
-            nfa_d[(left_accept, '')] = {right_nfa.q0}
 
-        return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
-    
 class Union(Regex):
     left: Regex
     right: Regex
@@ -70,35 +80,23 @@ class Union(Regex):
         self.left = left
         self.right = right
 
-    def thompson(self) -> NFA[int]:
-        # Combine two NFAs for union
-        left_nfa = self.left.thompson()
-        right_nfa = self.right.thompson()
-
-        start_state = Regex.get_state()
-        accept_state = Regex.get_state()
+    def children(self) -> list[Regex]:
+        return [self.left, self.right]
 
-        nfa_S = left_nfa.S | right_nfa.S
-        nfa_q0 = start_state
-        nfa_K = left_nfa.K | right_nfa.K | {start_state, accept_state}
-        nfa_F = {accept_state}
-
-        # Combine the transitions 
-        nfa_d = left_nfa.d.copy()
-        nfa_d.update(right_nfa.d)
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        (left_start, left_accept), (right_start, right_accept) = parts
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
         # New epsilon transition from the start state to each NFA's start state
-        nfa_d[(nfa_q0, '')] = {left_nfa.q0, right_nfa.q0}
-  
-        # New epsilon transitions from each NFA's accept states to the new accept state
-        for left_accept in left_nfa.F:
-            nfa_d[(left_accept, '')] = {accept_state}
+        builder.add_transition(start_state, EPSILON, left_start)
+        builder.add_transition(start_state, EPSILON, right_start)
 
-        for right_accept in right_nfa.F:
-            nfa_d[(right_accept, '')] = {accept_state}
+        # New epsilon transitions from each NFA's accept state to the new accept state
+        builder.add_transition(left_accept, EPSILON, accept_state)
+        builder.add_transition(right_accept, EPSILON, accept_state)
+        return start_state, accept_state
 
-        return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
-    
 
 class Star(Regex):
     regex: Regex
@@ -106,80 +104,68 @@ class Star(Regex):
     def __init__(self, regex: Regex):
         self.regex = regex
 
-    def thompson(self) -> NFA[int]:
-        old_nfa = self.regex.thompson()
-
-        start_state = Regex.get_state()
-        accept_state = Regex.get_state()
+    def children(self) -> list[Regex]:
+        return [self.regex]
 
-        nfa_S = old_nfa.S
-        nfa_q0 = start_state
-        nfa_K = old_nfa.K | {start_state, accept_state}
-        nfa_F = {accept_state}
-        nfa_d = old_nfa.d.copy()
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        [(old_start, old_accept)] = parts
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
         # Eps transition from the new start state to the old start state and new accept state
-        nfa_d[(nfa_q0, '')] = {old_nfa.q0, accept_state}
+        builder.add_transition(start_state, EPSILON, old_start)
+        builder.add_transition(start_state, EPSILON, accept_state)
 
-        # Eps transitions from old accept states to the old start state and new accept state
-        for old_accept in old_nfa.F:
-            nfa_d[(old_accept, '')] = {old_nfa.q0, accept_state} 
+        # Eps transitions from the old accept state to the old start state and new accept state
+        builder.add_transition(old_accept, EPSILON, old_start)
+        builder.add_transition(old_accept, EPSILON, accept_state)
+        return start_state, accept_state
 
-        return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
 
+class Plus(Regex):
+    regex: Regex
 
-class Plus:
-    def __init__(self, regex):
+    def __init__(self, regex: Regex):
         self.regex = regex
 
-    def thompson(self) -> NFA[int]:
-        old_nfa = self.regex.thompson()
-        start_state = Regex.get_state()
-        accept_state = Regex.get_state()
+    def children(self) -> list[Regex]:
+        return [self.regex]
 
-        nfa_S = old_nfa.S
-        nfa_q0 = start_state
-        nfa_K = old_nfa.K | {start_state, accept_state}
-        nfa_F = {accept_state}
-
-        nfa_d = old_nfa.d.copy()
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        [(old_start, old_accept)] = parts
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
         # Eps transition from the new start state to the old start state
-        nfa_d[(nfa_q0, '')] = {old_nfa.q0}
+        builder.add_transition(start_state, EPSILON, old_start)
 
-        # Eps transitions from old accept states to the old start state and new accept state
-        for old_accept in old_nfa.F:
-            nfa_d[(old_accept, '')] =  {old_nfa.q0, accept_state} 
+        # Eps transitions from the old accept state to the old start state and new accept state
+        builder.add_transition(old_accept, EPSILON, old_start)
+        builder.add_transition(old_accept, EPSILON, accept_state)
+        return start_state, accept_state
 
 
-        return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
-    
+class Optional(Regex):
+    regex: Regex
 
-class Optional:
-    def __init__(self, regex):
+    def __init__(self, regex: Regex):
         self.regex = regex
 
-    def thompson(self) -> NFA[int]:
-        old_nfa = self.regex.thompson()
-        start_state = Regex.get_state()
-        accept_state = Regex.get_state()
-
-        nfa_S = old_nfa.S
-        nfa_q0 = start_state
-        nfa_K = old_nfa.K | {start_state, accept_state}
-        nfa_F = {accept_state}
+    def children(self) -> list[Regex]:
+        return [self.regex]
 
-        nfa_d = old_nfa.d.copy()
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        [(old_start, old_accept)] = parts
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
 
         # Eps transition from the new start state to the old start state and new accept state
-        nfa_d[(nfa_q0, '')] = {old_nfa.q0, accept_state}
-
-        # Eps transitions from old accept states to the new accept state
-        for old_accept in old_nfa.F:
-            nfa_d[(old_accept, '')] =  {accept_state} 
+        builder.add_transition(start_state, EPSILON, old_start)
+        builder.add_transition(start_state, EPSILON, accept_state)
 
-
-        return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
+        # Eps transition from the old accept state to the new accept state
+        builder.add_transition(old_accept, EPSILON, accept_state)
+        return start_state, accept_state
 
 
 class Range(Regex):
@@ -190,109 +176,120 @@ class Range(Regex):
         self.start = start
         self.end = end
 
-    def thompson(self) -> NFA[int]:
+    def fragment(self, builder: NFABuilder, parts: list[tuple[int, int]]) -> tuple[int, int]:
+        start_state = builder.new_state()
+        accept_state = builder.new_state()
+
+        # A single transition on the whole range, split into character classes by the builder
+        builder.add_range(start_state, self.start, self.end, accept_state)
+        return start_state, accept_state
 
-        start_state = Regex.get_state()
-        accept_state = Regex.get_state()
-
-        nfa_S = set()
-        nfa_K = {start_state, accept_state}
-        nfa_q0 = start_state
-        nfa_d = {}
-        nfa_F = {accept_state}
-        # Create transitions for each character in the range
-
-        first_int_code = ord(self.start)
-        end_int_code = ord(self.end) + 1
-        for char_code in range(first_int_code, end_int_code):
-            char = chr(char_code)
-            nfa_S |= {char}
-            # Create a transition for the current character
-            if (start_state, char) not in nfa_d:
-                nfa_d[(start_state, char)] = set()
-
-            nfa_d[(start_state, char)].add(accept_state)
-        return NFA(S=nfa_S, K=nfa_K, q0=nfa_q0, d=nfa_d, F=nfa_F)
-
-        
-def parse_range(regex: str) -> tuple[Regex, str]:
-    if not regex or regex[0] != '[':
-        return None, regex
-    
-    # Create a Range object; a range looks like [A-Z]
-    new_regex = Range(regex[1], regex[3])
-    return new_regex, regex[5:]
-
-def parse_concat(regex: str) -> tuple[Regex, str]:
-    # Return None if the regex is empty
-    if not regex:
-        return None, regex
-
-    new_regex = None        
-    while regex:
-        # Check for regular characters or special characters and create a Character object
-        if regex[0].isalnum() or regex[0] in '-._:@\n':
-            next_regex = Character(regex[0])
-            regex = regex[1:]
-        elif regex[0] == '(':
-            next_regex, regex = parse_brackets(regex)
-        elif regex[0] == '[':
-            next_regex, regex = parse_range(regex)
-        # If a '\' is encountered, treat the next character as a regular character
-        elif regex[0] == '\\':
-            next_regex = Character(regex[1])
-            regex = regex[2:]
-        else:
-            break
-
-        # Apply operators '*', '+', '?' if present
-        if regex and regex[0] == '*':
-            next_regex = Star(next_regex)
-            regex = regex[1:]
-
-        if regex and regex[0] == '+':
-            next_regex = Plus(next_regex)
-            regex = regex[1:]
-        
-        if regex and regex[0] == '?':
-            next_regex = Optional(next_regex)
-            regex = regex[1:]
-
-        # Combine the new regex part with the existing one
-        if  new_regex is not None:
-            new_regex = Concat(new_regex, next_regex)
-        else:
-            new_regex = next_regex
-
-    return new_regex, regex
-
-def parse_union(regex: str) -> tuple[Regex, str]:
-
-    left, regex = parse_concat(regex)
-    # If there's no union operator, return the parsed left part
-    if not regex or regex[0] != '|':
-        return left, regex
-
-    while regex and regex[0] == '|':
-        regex = regex[1:]
-        right, regex = parse_concat(regex)
-        # Combine left and right parts of the union
-        left = Union(left, right)
-
-    return left, regex
-
-def parse_brackets(regex: str) -> tuple[Regex, str]:
-    if not regex or regex[0] != '(':
-        return None, regex
-
-    # Parse the content inside the brackets
-    out1, regex = parse_union(regex[1:])
-    # Skip the closing bracket
-    regex = regex[1:]  
-
-    return out1, regex
 
+class Parser:
+    # recursive descent parser reading the pattern through a cursor, so every character is
+    # looked at once and the rest of the pattern is never copied. spaces are skipped unless
+    # they are escaped with '\\'
+    regex: str
+    pos: int
 
+    def __init__(self, regex: str):
+        self.regex = regex
+        self.pos = 0
+
+    # returns the next character that is not an unescaped space, or '' at the end
+    def peek(self) -> str:
+        regex = self.regex
+        while self.pos < len(regex) and regex[self.pos] == ' ' and (self.pos == 0 or regex[self.pos - 1] != '\\'):
+            self.pos += 1
+        return regex[self.pos] if self.pos < len(regex) else ''
+
+    # returns the next character and moves past it
+    def next(self) -> str:
+        char = self.peek()
+        if not char:
+            raise IndexError("unexpected end of regex")
+        self.pos += 1
+        return char
+
+    def parse_range(self) -> Regex:
+        if self.peek() != '[':
+            return None
+
+        # Create a Range object; a range looks like [A-Z]
+        self.next()
+        start = self.next()
+        self.next()
+        end = self.next()
+        self.next()
+        return Range(start, end)
+
+    def parse_concat(self) -> Regex:
+        new_regex = None
+        while True:
+            char = self.peek()
+            # Check for regular characters or special characters and create a Character object
+            if char and (char.isalnum() or char in '-._:@\n'):
+                next_regex = Character(char)
+                self.pos += 1
+            elif char == '(':
+                next_regex = self.parse_brackets()
+            elif char == '[':
+                next_regex = self.parse_range()
+            # If a '\\' is encountered, treat the next character as a regular character
+            elif char == '\\':
+                self.pos += 1
+                next_regex = Character(self.next())
+            else:
+                break
+
+            # Apply operators '*', '+', '?' if present
+            if self.peek() == '*':
+                next_regex = Star(next_regex)
+                self.pos += 1
+
+            if self.peek() == '+':
+                next_regex = Plus(next_regex)
+                self.pos += 1
+
+            if self.peek() == '?':
+                next_regex = Optional(next_regex)
+                self.pos += 1
+
+            # Combine the new regex part with the existing one
+            if new_regex is not None:
+                new_regex = Concat(new_regex, next_regex)
+            else:
+                new_regex = next_regex
+
+        return new_regex
+
+    def parse_union(self) -> Regex:
+        left = self.parse_concat()
+        while self.peek() == '|':
+            self.pos += 1
+            right = self.parse_concat()
+            # Combine left and right parts of the union
+            left = Union(left, right)
+
+        return left
+
+    def parse_brackets(self) -> Regex:
+        if self.peek() != '(':
+            return None
+
+        # Parse the content inside the brackets
+        self.pos += 1
+        out = self.parse_union()
+        # Skip the closing bracket
+        if self.peek():
+            self.pos += 1
+
+        return out
+
+
+# the parsed regexes are shared by everyone who parses the same pattern, so they
+# should not be changed
+@lru_cache(maxsize=1024)
 def parse_regex(regex: str) -> Regex:
     # create a Regex object by parsing the string
     # the checker will call this function, then the thompson method of the generated object.
@@ -300,10 +297,4 @@ def parse_regex(regex: str) -> Regex:
 
     if regex in ['(', ')', '++', 'lambda', ':', "+"]:
         return Character(regex)
-    # Get rid of spaces but keep the escaped ones
-    regex = regex.replace("\\ ", "\\space")
-    regex = regex.replace(" ", "")
-    regex = regex.replace("\\space", "\\ ")
-    out_regex = parse_union(regex)[0]
-
-    return out_regex
\ No newline at end of file
+    return Parser(regex).parse_union()
@@ -0,0 +1,117 @@
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from collections.abc import Callable
+from typing import BinaryIO, TextIO
+
+# evaluates a program and writes its result to a stream. the last argument
+# is the session of the request, None if it has none
+Evaluate = Callable[[str, TextIO, str | None], None]
+
+
+# evaluates the program of one request and returns the response. the result is
+# None if the program failed, and the error None if it did not
+def respond(request: dict, evaluate: Evaluate) -> dict:
+    start = time.perf_counter()
+    buffer = io.StringIO()
+    try:
+        evaluate(request['program'], buffer, request.get('session'))
+        result, error = buffer.getvalue(), None
+    except Exception as exception:
+        result, error = None, f'{type(exception).__name__}: {exception}'
+    response = {'result': result, 'error': error, 'latency': time.perf_counter() - start}
+    if 'id' in request:
+        response['id'] = request['id']
+    return response
+
+
+# answers the requests read from rfile on wfile, one json object per line,
+# until rfile is closed. the latency of each request is also written to log
+def handle(rfile: BinaryIO, wfile: BinaryIO, evaluate: Evaluate, log: TextIO, lock: threading.Lock) -> None:
+    for line in rfile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as exception:
+            response = {'result': None, 'error': f'bad request: {exception}', 'latency': 0.0}
+        else:
+            response = respond(request, evaluate)
+        wfile.write(json.dumps(response).encode() + b'\n')
+        wfile.flush()
+        with lock:
+            log.write(f"request {response.get('id', '-')}: {response['latency'] * 1000:.3f} ms"
+                      f"{'' if response['error'] is None else ' (error)'}\n")
+            log.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # evaluate is shared by all the clients, which are answered on their own threads
+    def __init__(self, address: str, evaluate: Evaluate, log: TextIO) -> None:
+        self.evaluate = evaluate
+        self.log = log
+        self.lock = threading.Lock()
+        super().__init__(address, Handler)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        handle(self.rfile, self.wfile, self.server.evaluate, self.server.log, self.server.lock)
+
+
+# returns True if address is a unix socket that no server listens on, like the
+# socket left by a server that was not shut down
+def isStaleSocket(address: str) -> bool:
+    if not stat.S_ISSOCK(os.lstat(address).st_mode):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(address)
+        except ConnectionRefusedError:
+            return True
+        except OSError:
+            return False
+    return False
+
+
+# answers requests until interrupted, on the unix socket at address or, if the
+# address is '-', on stdin and stdout
+def serve(address: str, evaluate: Evaluate, log: TextIO = sys.stderr) -> None:
+    if address == '-':
+        handle(sys.stdin.buffer, sys.stdout.buffer, evaluate, log, threading.Lock())
+        return
+
+    # a socket left by a server that was not shut down is replaced, anything else
+    # (a file, or the socket of a server that still runs) is left alone
+    if os.path.lexists(address):
+        if not isStaleSocket(address):
+            sys.exit(f"{address} already exists and is not the socket of a stopped server")
+        os.unlink(address)
+    # a terminated server also removes its socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with Server(address, evaluate, log) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(address)
+
+
+# sends a program to the server listening at address and returns its response
+def request(address: str, program: str) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(address)
+        client.sendall(json.dumps({'program': program}).encode() + b'\n')
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
@@ -0,0 +1,676 @@
+import bisect
+import io
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import TextIO
+from .Interpreter import APPEND, COLON, ERROR, KIND, LAMBDA, L_PAR, NUMBER, R_PAR, SPACE, SUM, VARIABLE, Tree, buildTree, evaluate, readText
+from .Lexer import Lexer, TokenArrays
+from . import Stats
+
+
+# characters compared first when looking for the edited part of a program. the
+# compared chunks double while they are equal, then halve to find the difference
+COMPARE_CHUNK = 4096
+
+# how much the tree of a session can grow, relative to its size when it was
+# last built from scratch, before it is built again
+COMPACT_GROWTH = 4
+
+# the most token positions kept in a block of Positions
+POSITIONS_BLOCK = 1024
+
+
+# returns the length of the common prefix of a and b
+def commonPrefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    size = COMPARE_CHUNK
+    while True:
+        size = min(size, n - i)
+        if size == 0 or a[i : i + size] != b[i : i + size]:
+            break
+        i += size
+        size *= 2
+    # the first difference is in the size characters from i
+    while size > 1:
+        half = size // 2
+        if a[i : i + half] == b[i : i + half]:
+            i += half
+            size -= half
+        else:
+            size = half
+    return i
+
+
+# returns the length of the common suffix of a and b, at most limit
+def commonSuffix(a: str, b: str, limit: int) -> int:
+    i = 0
+    size = COMPARE_CHUNK
+    while True:
+        size = min(size, limit - i)
+        if size == 0 or a[len(a) - i - size : len(a) - i] != b[len(b) - i - size : len(b) - i]:
+            break
+        i += size
+        size *= 2
+    while size > 1:
+        half = size // 2
+        if a[len(a) - i - half : len(a) - i] == b[len(b) - i - half : len(b) - i]:
+            i += half
+            size -= half
+        else:
+            size = half
+    return i
+
+
+# positions kept in blocks of at most POSITIONS_BLOCK, each relative to the offset
+# of its block: moving the positions after an edit only changes the offsets of the
+# blocks after it
+class Positions:
+    blocks: list[array]
+    offsets: list[int]
+    # the index of the first position of each block
+    firsts: list[int]
+    size: int
+
+    def __init__(self, values: array) -> None:
+        self.blocks = [values[i : i + POSITIONS_BLOCK] for i in range(0, len(values), POSITIONS_BLOCK)] or [values[:0]]
+        self.offsets = [0] * len(self.blocks)
+        self.firsts = list(range(0, len(self.blocks) * POSITIONS_BLOCK, POSITIONS_BLOCK))
+        self.size = len(values)
+
+    def __len__(self) -> int:
+        return self.size
+
+    # returns the block of the position at index and the index in the block
+    def locate(self, index: int) -> tuple[int, int]:
+        block = bisect.bisect_right(self.firsts, index) - 1
+        return block, index - self.firsts[block]
+
+    def __getitem__(self, index: int) -> int:
+        block, index = self.locate(index)
+        return self.offsets[block] + self.blocks[block][index]
+
+    # returns the positions from start to end
+    def slice(self, start: int, end: int) -> array:
+        positions = array('q')
+        end = min(end, self.size)
+        block, index = self.locate(start)
+        while start < end:
+            values = self.blocks[block][index : index + end - start]
+            positions.extend(map(self.offsets[block].__add__, values))
+            start += len(values)
+            block += 1
+            index = 0
+        return positions
+
+    # like bisect.bisect_left and bisect.bisect_right on increasing positions
+    def bisectLeft(self, position: int, low: int = 0) -> int:
+        blocks = self.blocks
+        offsets = self.offsets
+        if self.size == 0:
+            return low
+        block = bisect.bisect_left(range(len(blocks)), position, key=lambda block: offsets[block] + blocks[block][0]) - 1
+        if block < 0:
+            return low
+        return max(low, self.firsts[block] + bisect.bisect_left(blocks[block], position - offsets[block]))
+
+    def bisectRight(self, position: int, low: int = 0) -> int:
+        blocks = self.blocks
+        offsets = self.offsets
+        if self.size == 0:
+            return low
+        block = bisect.bisect_right(range(len(blocks)), position, key=lambda block: offsets[block] + blocks[block][0]) - 1
+        if block < 0:
+            return low
+        return max(low, self.firsts[block] + bisect.bisect_right(blocks[block], position - offsets[block]))
+
+    # replaces the positions from start to end with positions and moves those
+    # after them by shift
+    def splice(self, start: int, end: int, positions: array, shift: int) -> None:
+        blocks = self.blocks
+        offsets = self.offsets
+        firsts = self.firsts
+        first, index = self.locate(start)
+        last, end_index = self.locate(end)
+        # the positions of the changed blocks, in one relative to the offset of the first
+        offset = offsets[first]
+        values = blocks[first][:index]
+        values.extend(map((-offset).__add__, positions))
+        values.extend(map((offsets[last] + shift - offset).__add__, blocks[last][end_index:]))
+        last += 1
+        if len(values) < POSITIONS_BLOCK // 2 and last < len(blocks):
+            values.extend(map((offsets[last] + shift - offset).__add__, blocks[last]))
+            last += 1
+        new_blocks = [values[i : i + POSITIONS_BLOCK] for i in range(0, len(values), POSITIONS_BLOCK)]
+        if not new_blocks and first == 0 and last == len(blocks):
+            new_blocks = [values]
+        count = len(positions) - (end - start)
+        blocks[first:last] = new_blocks
+        offsets[first:last] = [offset] * len(new_blocks)
+        firsts[first:last] = range(firsts[first], firsts[first] + len(new_blocks) * POSITIONS_BLOCK, POSITIONS_BLOCK)
+        last = first + len(new_blocks)
+        if shift:
+            offsets[last:] = [offset + shift for offset in offsets[last:]]
+        if count:
+            firsts[last:] = [index + count for index in firsts[last:]]
+        self.size += count
+
+
+# tells if the tokens, given by their kinds, are a run of children of a bracket
+# that can be parsed without the rest of the program: numbers and whole brackets,
+# without lambda functions or variables (whose values depend on the lambda
+# functions before them) and without sum or append functions between the children
+def parsesAlone(kinds: Iterable[int]) -> bool:
+    depth = 0
+    for kind in kinds:
+        if kind == L_PAR:
+            depth += 1
+        elif kind == R_PAR:
+            depth -= 1
+            if depth < 0:
+                return False
+        elif kind == LAMBDA or kind == VARIABLE or kind == ERROR:
+            return False
+        elif depth == 0 and kind != SPACE and kind != NUMBER:
+            return False
+    return depth == 0
+
+
+class Session:
+    # a program evaluated again after each of its edits, parsing again only the part
+    # that changed when it can (see Incremental Evaluation in the README)
+    lexer: Lexer
+    # the text of the last version, as read by readContent
+    text: str
+    # the tokens of the last version, like those of TokenArrays: the token names of
+    # the lexer, the code of each token and where it starts (it ends where the next
+    # one starts), and the kind of the nodes of each code
+    names: list[str]
+    codes: array
+    starts: Positions
+    kind_of: list[int]
+    # the node of each token (see buildTree)
+    owners: list[int]
+    # the number of LAMBDA and VARIABLE tokens
+    lambdas: int
+    # None if the program has to be built from scratch
+    tree: Tree | None
+    # the needs and reduced arguments of solveLambda and the solved argument
+    # of solveSumAndAppend
+    needs: dict[int, int]
+    reduced: dict[int, int]
+    solved: dict[int, int]
+    result: str
+    # for a program without lambda functions, where the output of each token is in
+    # the result (see layout), else None
+    outs: Positions | None
+    # the brackets with a sum or append function, whose output is a single value,
+    # that are not inside another one
+    operations: set[int]
+    # the size of the tree when it was last built from scratch
+    size: int
+
+    def __init__(self, lexer: Lexer) -> None:
+        self.lexer = lexer
+        self.text = ''
+        self.tree = None
+        self.result = ''
+
+    # evaluates the new version of the program and returns its result
+    def update(self, program: str) -> str:
+        text = readText(program)
+        if self.tree is None:
+            return self.rebuild(text)
+        if text == self.text:
+            return self.result
+
+        try:
+            changed = self.edit(text)
+        except (KeyError, ValueError):
+            # the errors buildTree raises for a program it cannot parse: the
+            # program is built again, which reports them where they are
+            Stats.count("session_edit_errors")
+            changed = None
+        except BaseException:
+            # the tokens and the tree might be half changed
+            self.tree = None
+            raise
+        if changed is None or len(self.tree) > COMPACT_GROWTH * self.size:
+            return self.rebuild(text)
+        self.text = text
+        if not changed:
+            return self.result
+        return self.evaluate()
+
+    # lexes, parses and evaluates the whole program
+    def rebuild(self, text: str) -> str:
+        Stats.count("session_rebuilds")
+        self.tree = None
+        tokens = self.lexer.lexTokens(text)
+        self.text = text
+        self.names = tokens.names
+        self.kind_of = [KIND[name] for name in tokens.names]
+        self.codes = tokens.codes
+        self.starts = Positions(tokens.starts)
+        self.lambdas = sum(self.codes.count(code) for code, kind in enumerate(self.kind_of) if kind == LAMBDA or kind == VARIABLE)
+        self.owners = []
+        self.needs = {}
+        self.reduced = {}
+        self.solved = {}
+        # the nodes are changed in place by the edits, so they are not shared
+        self.tree = buildTree(tokens, owners=self.owners, intern=False)
+        result = self.evaluate()
+        self.size = len(self.tree)
+        if tokens.error is not None:
+            # the tokens after a lexing error are not known
+            self.tree = None
+        return result
+
+    def evaluate(self) -> str:
+        tree = self.tree
+        try:
+            laid = None
+            if self.lambdas == 0 and tree.root >= 0:
+                self.operations = set()
+                laid = self.layout(0, len(self.codes), -1, tree.root, -1, 0)
+            if laid is not None:
+                self.result, outs = laid
+                self.outs = Positions(outs)
+                return self.result
+            self.outs = None
+            tree.markNeeds(tree.root, self.needs)
+            root = tree.solveLambda(tree.root, self.needs, self.reduced)
+            root = tree.solveSumAndAppend(root, self.solved)
+            self.result = tree.getResult(root)
+        except BaseException:
+            self.tree = None
+            raise
+        return self.result
+
+    # applies the edit that turns the last version into text to the tokens
+    # and the tree. returns True if the result has to be evaluated again,
+    # False if it is up to date and None if the program must be built again
+    def edit(self, text: str) -> bool | None:
+        old = self.text
+        codes = self.codes
+        starts = self.starts
+        kind_of = self.kind_of
+        start = commonPrefix(old, text)
+        end = len(text) - commonSuffix(old, text, min(len(old), len(text)) - start)
+        delta = len(text) - len(old)
+
+        # the tokens before the last space before the edit are not changed
+        a = starts.bisectRight(start - 1) - 1 if start > 0 else -1
+        while a >= 0 and kind_of[codes[a]] != SPACE:
+            a -= 1
+        a += 1
+
+        # lexes until a token starts where an old one did, after the edit
+        new_codes = array('h')
+        new_starts = array('q')
+        i = starts[a] if a < len(starts) else len(old)
+        b = len(codes)
+        while i < len(text):
+            if i >= end:
+                k = starts.bisectLeft(i - delta, a)
+                if k < len(starts) and starts[k] == i - delta:
+                    b = k
+                    break
+            match = self.lexer.codeAt(text, i)
+            if match is None:
+                return None
+            code, j = match
+            new_codes.append(code)
+            new_starts.append(i)
+            i = j
+        Stats.count("relexed_tokens", len(new_codes))
+
+        # the tokens that did not change around the edit, with the same code and lexem
+        new_ends = new_starts[1:]
+        new_ends.append(i)
+        old_ends = starts.slice(a + 1, b + 1)
+        if b == len(starts):
+            old_ends.append(len(old))
+        n = min(len(new_codes), b - a)
+        x = a
+        while x - a < n and new_codes[x - a] == codes[x] and text[new_starts[x - a] : new_ends[x - a]] == old[starts[x] : old_ends[x - a]]:
+            x += 1
+        same = 0
+        while same < n - (x - a) and new_codes[-1 - same] == codes[b - 1 - same] and text[new_starts[-1 - same] : new_ends[-1 - same]] == old[starts[b - 1 - same] : old_ends[-1 - same]]:
+            same += 1
+        y = a + len(new_codes) - same
+        old_codes = codes[a:b]
+        shift = len(new_codes) - (b - a)
+        for code, kind in enumerate(kind_of):
+            if kind == LAMBDA or kind == VARIABLE:
+                self.lambdas += new_codes.count(code) - old_codes.count(code)
+        codes[a:b] = new_codes
+        starts.splice(a, b, new_starts, delta)
+        if x == y and x == b - same:
+            return False
+
+        # the changed tokens, [x, y) in the new tokens and [x, y - shift) in the
+        # old ones, grow to the brackets around them until they can be parsed alone
+        while True:
+            old_region = [kind_of[codes[t] if t < a else old_codes[t - a] if t < b else codes[t + shift]] for t in range(x, y - shift)]
+            if parsesAlone(kind_of[code] for code in codes[x:y]) and parsesAlone(old_region) and not self.inLambda(x):
+                parent, previous = self.parentAt(x)
+                if parent >= 0:
+                    break
+            x, y = self.enclosing(x, y)
+            if x < 0:
+                return None
+        Stats.count("reparsed_tokens", y - x)
+
+        tree = self.tree
+        first = tree.first
+        last = tree.last
+        next = tree.next
+        up = tree.up
+        owners = self.owners
+        old_children = []
+        depth = 0
+        for kind, owner in zip(old_region, owners[x : y - shift]):
+            if depth == 0 and (kind == L_PAR or kind == NUMBER):
+                old_children.append(owner)
+            if kind == L_PAR:
+                depth += 1
+            elif kind == R_PAR:
+                depth -= 1
+        following = first[parent] if previous < 0 else next[previous]
+        for child in old_children:
+            if child != following or up[child] != parent:
+                return None
+            following = next[child]
+
+        holder = tree.add('(', L_PAR)
+        new_owners = []
+        ends = starts.slice(x + 1, y + 1)
+        if y == len(starts):
+            ends.append(len(text))
+        region = TokenArrays(self.names, text, codes[x:y], starts.slice(x, y), ends)
+        buildTree(region, tree, holder, new_owners, intern=False)
+        new_children = list(tree.children(holder))
+
+        # a bracket that was its own value stays so if the changed children have
+        # no functions, and so do the nodes above it that were their own value
+        head = first[parent]
+        solved = self.solved
+        kept = head in solved and first[solved[head]] == head
+        kept = kept and not any(kind_of[code] == SUM or kind_of[code] == APPEND for code in codes[x:y])
+        kept = kept and not any(kind == SUM or kind == APPEND for kind in old_region)
+        solved.pop(head, None)
+        self.reduced.pop(head, None)
+        node = up[parent]
+        while node >= 0:
+            self.reduced.pop(first[node], None)
+            node = up[node]
+        node = up[parent] if kept else parent
+        while node >= 0 and first[node] in solved and first[solved[first[node]]] == first[node]:
+            node = up[node]
+        while node >= 0:
+            solved.pop(first[node], None)
+            node = up[node]
+
+        empty = first[parent] < 0
+        link = previous
+        for child in new_children:
+            if link < 0:
+                first[parent] = child
+            else:
+                next[link] = child
+            up[child] = parent
+            link = child
+        if link < 0:
+            first[parent] = following
+        else:
+            next[link] = following
+        if following < 0:
+            last[parent] = link
+        owners[x : y - shift] = new_owners
+
+        # the old and the new children have no lambda functions or variables
+        if head in self.needs:
+            self.needs[first[parent]] = self.needs.pop(head)
+        for child in new_children:
+            tree.markNeeds(child, self.needs)
+        if kept:
+            # the bracket itself, whose copies have the old children
+            solved[first[parent]] = parent
+        if empty != (first[parent] < 0):
+            # '()' and '( ... )' do not have the same output around the children
+            return True
+        return self.spliceResult(x, y, shift, parent, new_children[0] if new_children else following, following)
+
+    # puts the output of the changed tokens, tokens[x:y] in place of tokens[x:y - shift]
+    # of the last version, in the result instead of evaluating it again. the tokens are
+    # the children of parent from child to following. returns True if the result has
+    # to be evaluated again
+    def spliceResult(self, x: int, y: int, shift: int, parent: int, child: int, following: int) -> bool:
+        outs = self.outs
+        if outs is None or self.lambdas:
+            return True
+        tree = self.tree
+        up = tree.up
+        # the highest bracket around the tokens whose output is a single value
+        top = -1
+        node = parent
+        while node >= 0:
+            if node in self.operations:
+                top = node
+            node = up[node]
+
+        if top < 0:
+            if y - shift >= len(outs):
+                return True
+            start = outs[x]
+            end = outs[y - shift]
+            laid = self.layout(x, y, parent, child, following, start)
+            if laid is None:
+                return True
+            output, new_outs = laid
+        else:
+            while self.owners[x] != top or self.kind_of[self.codes[x]] != L_PAR:
+                x, y = self.enclosing(x, y)
+                if x < 0:
+                    return True
+            if y - shift >= len(outs):
+                return True
+            start = outs[x]
+            end = outs[y - shift]
+            output = tree.getResult(tree.solveSumAndAppend(top, self.solved))
+            if up[top] >= 0:
+                output += ' '
+            new_outs = array('q', [start]) * (y - x)
+        Stats.count("spliced_results")
+        self.result = self.result[:start] + output + self.result[end:]
+        outs.splice(x, y - shift, new_outs, len(output) - (end - start))
+        return False
+
+    # writes the output of tokens[x:y], the children of bracket from child to following
+    # (or the root, if bracket is -1), from position on in the result. returns it with the
+    # output position of each token, which is where the token is written, or where the
+    # next child is for spaces and where the bracket is for the tokens inside a bracket
+    # whose output is a single value. returns None if the nodes are not those children,
+    # as in a tree with lambda functions, which has to be evaluated
+    def layout(self, x: int, y: int, bracket: int, child: int, following: int, position: int) -> tuple[str, array] | None:
+        tree = self.tree
+        kinds = tree.kinds
+        values = tree.values
+        first = tree.first
+        next = tree.next
+        codes = self.codes
+        kind_of = self.kind_of
+        owners = self.owners
+        pieces = []
+        outs = array('q')
+        # the brackets around bracket, and the child after each of them
+        stack = []
+        t = x
+        while t < y:
+            kind = kind_of[codes[t]]
+            owner = owners[t]
+            outs.append(position)
+            t += 1
+            if kind == SPACE or kind == COLON:
+                continue
+            if kind == R_PAR:
+                if owner != bracket or child >= 0 or not stack:
+                    return None
+                bracket, child = stack.pop()
+                piece = ')' if bracket < 0 else ') '
+            elif owner != child or owner < 0:
+                return None
+            elif kind == NUMBER:
+                piece = values[owner] if bracket < 0 else values[owner] + ' '
+                child = next[owner]
+            elif kind != L_PAR:
+                return None
+            else:
+                operation = first[owner]
+                while operation >= 0 and kinds[operation] != SUM and kinds[operation] != APPEND:
+                    operation = next[operation]
+                if operation < 0:
+                    stack.append((bracket, next[owner]))
+                    bracket, child = owner, first[owner]
+                    piece = '(' if child < 0 else '( '
+                else:
+                    # the tokens up to the end of the bracket
+                    depth = 1
+                    while depth:
+                        if t >= y:
+                            return None
+                        kind = kind_of[codes[t]]
+                        if kind == L_PAR:
+                            depth += 1
+                        elif kind == R_PAR:
+                            depth -= 1
+                        outs.append(position)
+                        t += 1
+                    if owners[t - 1] != owner:
+                        return None
+                    self.operations.add(owner)
+                    piece = tree.getResult(tree.solveSumAndAppend(owner, self.solved))
+                    if bracket >= 0:
+                        piece += ' '
+                    child = next[owner]
+            pieces.append(piece)
+            position += len(piece)
+        if stack or child != following:
+            return None
+        return ''.join(pieces), outs
+
+    # tells if a number parsed before tokens[index] could be taken out of the
+    # bracket it is in, which buildTree does for the numbers in the body of a
+    # lambda function before the first ')'
+    def inLambda(self, index: int) -> bool:
+        if not self.lambdas:
+            return False
+        codes = self.codes
+        kind_of = self.kind_of
+        for t in range(index - 1, -1, -1):
+            kind = kind_of[codes[t]]
+            if kind == R_PAR:
+                return False
+            if kind == LAMBDA or kind == VARIABLE:
+                return True
+        return False
+
+    # returns the bracket the node of tokens[index] would be added to, and
+    # the child of the bracket before it (-1 if it would be the first one),
+    # or (-1, -1) if it would not be added to a bracket
+    def parentAt(self, index: int) -> tuple[int, int]:
+        codes = self.codes
+        kind_of = self.kind_of
+        kinds = self.tree.kinds
+        up = self.tree.up
+        t = index - 1
+        while t >= 0 and kind_of[codes[t]] == SPACE:
+            t -= 1
+        if t < 0 or self.owners[t] < 0:
+            return -1, -1
+        owner = self.owners[t]
+        kind = kind_of[codes[t]]
+        if kind == L_PAR:
+            return owner, -1
+        if kind == R_PAR:
+            # after the bracket it closes, in the bracket around it
+            node = owner
+            while up[node] >= 0 and kinds[up[node]] != L_PAR:
+                node = up[node]
+            if up[node] < 0:
+                return -1, -1
+            return up[node], node
+        if kind == NUMBER and up[owner] >= 0 and kinds[up[owner]] == L_PAR:
+            return up[owner], owner
+        return -1, -1
+
+    # returns the tokens of the bracket around tokens[x:y], or (-1, -1) if
+    # there is none
+    def enclosing(self, x: int, y: int) -> tuple[int, int]:
+        codes = self.codes
+        kind_of = self.kind_of
+        depth = 0
+        while x > 0:
+            x -= 1
+            kind = kind_of[codes[x]]
+            if kind == R_PAR:
+                depth += 1
+            elif kind == L_PAR:
+                if depth == 0:
+                    break
+                depth -= 1
+        else:
+            return -1, -1
+        depth = 0
+        while y < len(codes):
+            y += 1
+            kind = kind_of[codes[y - 1]]
+            if kind == L_PAR:
+                depth += 1
+            elif kind == R_PAR:
+                if depth == 0:
+                    return x, y
+                depth -= 1
+        return -1, -1
+
+
+# evaluates the programs sent to a server. the programs sent in the same
+# session are the versions of a program being edited, each one evaluated
+# from the last one by a Session. at most max_sessions are kept, the least
+# recently used one is dropped for a new one (its next program is then
+# evaluated from scratch)
+class Sessions:
+    lexer: Lexer
+    max_sessions: int
+    # key -> (session, lock), from the least to the most recently used
+    sessions: OrderedDict[str, tuple[Session, threading.Lock]]
+    lock: threading.Lock
+    evictions: int
+
+    def __init__(self, lexer: Lexer, max_sessions: int = 64) -> None:
+        if max_sessions < 1:
+            raise ValueError("at least one session must be kept")
+        self.lexer = lexer
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def evaluate(self, program: str, stream: TextIO, key: str | None = None) -> None:
+        if key is None:
+            evaluate(self.lexer, io.StringIO(program), stream)
+            return
+        with self.lock:
+            if key in self.sessions:
+                self.sessions.move_to_end(key)
+            else:
+                if len(self.sessions) >= self.max_sessions:
+                    self.sessions.popitem(last=False)
+                    self.evictions += 1
+                self.sessions[key] = (Session(self.lexer), threading.Lock())
+            session, lock = self.sessions[key]
+        with lock:
+            stream.write(session.update(program))
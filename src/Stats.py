@@ -0,0 +1,89 @@
+import functools
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+
+# the wall time of the phases of a run (seconds, summed if a phase runs more
+# than once) and its counters. hooks are called with (name, seconds) at the
+# end of every phase
+class Stats:
+    times: dict[str, float]
+    counters: dict[str, int]
+    hooks: list[Callable[[str, float], None]]
+
+    def __init__(self) -> None:
+        self.times = {}
+        self.counters = {}
+        self.hooks = []
+
+    def addHook(self, hook: Callable[[str, float], None]) -> None:
+        self.hooks.append(hook)
+
+    def addTime(self, name: str, seconds: float) -> None:
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def asDict(self) -> dict[str, dict]:
+        return {"times": dict(self.times), "counters": dict(self.counters)}
+
+    # adds the times and counters of another run, as returned by its asDict
+    def merge(self, data: dict[str, dict]) -> None:
+        for name, seconds in data["times"].items():
+            self.addTime(name, seconds)
+        for name, n in data["counters"].items():
+            self.count(name, n)
+
+
+# the stats of the run being recorded, None when nothing is recorded. the
+# instrumented code checks it before doing any work, so that recording
+# costs nothing when it is off
+current: Stats | None = None
+
+
+# records the stats of the code run inside the with block
+@contextmanager
+def record(stats: Stats | None = None) -> Iterator[Stats]:
+    global current
+    previous = current
+    current = stats if stats is not None else Stats()
+    try:
+        yield current
+    finally:
+        current = previous
+
+
+# times the code run inside the with block as the phase name
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    stats = current
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.addTime(name, time.perf_counter() - start)
+
+
+# decorator timing every call of a function as the phase name
+def timed(name: str) -> Callable[[Callable], Callable]:
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if current is None:
+                return function(*args, **kwargs)
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    if current is not None:
+        current.count(name, n)
@@ -0,0 +1,77 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from src import main
+from src.Batch import batchFiles, runBatch
+from src.Interpreter import SPEC
+from src.Lexer import Lexer
+
+PROGRAMS = {
+    "b.txt": "(+ ( 1 2 ) )",
+    "a.txt": "(++ ( (1) (2 3) ) )",
+    "c.txt": "( 1 # 2 )",
+    "d.txt": "((lambda x: ( x x )) 4)",
+}
+
+
+class BatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.lexer = Lexer(SPEC)
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.programs = os.path.join(self.directory, "programs")
+        os.mkdir(self.programs)
+        os.mkdir(os.path.join(self.programs, "nested"))
+        for name, program in PROGRAMS.items():
+            with open(os.path.join(self.programs, name), "w") as file:
+                file.write(program)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.programs, name)
+
+    # the files of a directory are taken in alphabetical order, without its
+    # directories, and those of a manifest in its order
+    def test_files(self) -> None:
+        self.assertEqual(batchFiles([self.programs]), [self.path(name) for name in sorted(PROGRAMS)])
+        manifest = os.path.join(self.directory, "manifest")
+        with open(manifest, "w") as file:
+            file.write(f"{self.path('d.txt')}\n\n  {self.path('b.txt')}  \n{self.programs}\n")
+        self.assertEqual(
+            batchFiles([self.path("c.txt"), "@" + manifest]),
+            [self.path("c.txt"), self.path("d.txt"), self.path("b.txt")] + [self.path(name) for name in sorted(PROGRAMS)],
+        )
+
+    # the results are written in input order whatever the number of workers,
+    # and a program that fails does not stop the others
+    def test_order_and_failures(self) -> None:
+        paths = [self.path("d.txt"), self.path("missing.txt"), self.programs]
+        expected = [
+            f"{self.path('d.txt')}: ( ( 4 4 ) )",
+            f"{self.path('missing.txt')}: error: FileNotFoundError",
+            f"{self.path('a.txt')}: ( 1 2 3 )",
+            f"{self.path('b.txt')}: 3",
+            f"{self.path('c.txt')}: ",
+            f"{self.path('d.txt')}: ( ( 4 4 ) )",
+        ]
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                stream = io.StringIO()
+                self.assertEqual(runBatch(self.lexer, paths, jobs, stream), 1)
+                lines = stream.getvalue().splitlines()
+                # the message of the error names the file
+                self.assertTrue(lines[1].startswith(expected[1] + ": "), lines[1])
+                self.assertEqual(lines[:1] + lines[2:], expected[:1] + expected[2:])
+
+    def test_jobs_argument(self) -> None:
+        for arguments in (["--jobs"], ["--jobs", self.programs], ["--jobs", "0", self.programs], ["--jobs", "2"], []):
+            with self.subTest(arguments=arguments):
+                with mock.patch.object(main, "argv", ["main", "--batch"] + arguments):
+                    with self.assertRaises(SystemExit) as context:
+                        main.main()
+                self.assertTrue(str(context.exception.code).startswith(main.BATCH_USAGE))
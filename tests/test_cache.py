@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from src import Stats
+from src.Interpreter import SPEC
+from src.Lexer import Lexer, getCachePath
+
+WORDS = ["(+ ( 12 345 ) )", "((lambda x: ( x x )) 4)", "abc+++9", "( 1 # 2 )"]
+
+
+class CacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.lexer = Lexer(SPEC)
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def assertSameLexer(self, lexer: Lexer) -> None:
+        for word in WORDS:
+            self.assertEqual(lexer.lex(word), self.lexer.lex(word))
+        self.assertEqual(lexer.getTokenTable(), self.lexer.getTokenTable())
+        self.assertEqual(lexer.getStateCounts(), self.lexer.getStateCounts())
+
+    def test_save_and_load(self) -> None:
+        path = os.path.join(self.directory.name, "lexer.json")
+        self.lexer.save(path)
+        self.assertSameLexer(Lexer.load(path))
+        self.assertEqual(os.listdir(self.directory.name), ["lexer.json"])
+
+    def test_lazy_lexer_is_not_saved(self) -> None:
+        with self.assertRaises(ValueError):
+            Lexer(SPEC, lazy=True).save(os.path.join(self.directory.name, "lexer.json"))
+
+    # the second from_cache loads the file written by the first one
+    def test_from_cache(self) -> None:
+        self.assertSameLexer(Lexer.from_cache(SPEC, self.directory.name))
+        self.assertTrue(os.path.exists(getCachePath(SPEC, self.directory.name)))
+        with mock.patch.object(Lexer, "__init__", side_effect=AssertionError("built again")):
+            self.assertSameLexer(Lexer.from_cache(SPEC, self.directory.name))
+
+    # the state counts are recorded whether the lexer was built or loaded
+    def test_state_counters(self) -> None:
+        expected = {f"states.{name}": states for name, states in self.lexer.getStateCounts().items()}
+        for _ in range(2):
+            with Stats.record() as stats:
+                Lexer.from_cache(SPEC, self.directory.name)
+            self.assertEqual({name: n for name, n in stats.counters.items() if name.startswith("states.")}, expected)
+
+    def test_key(self) -> None:
+        path = getCachePath(SPEC, self.directory.name)
+        self.assertNotEqual(getCachePath(SPEC, self.directory.name, minimize=False), path)
+        self.assertNotEqual(getCachePath(SPEC[:-1], self.directory.name), path)
+        with mock.patch("src.Lexer.getCompilerHash", return_value="another compiler"):
+            self.assertNotEqual(getCachePath(SPEC, self.directory.name), path)
+
+    # a file that does not describe a lexer is rejected by load, and from_cache
+    # builds the lexer again and replaces the file
+    def test_bad_files(self) -> None:
+        path = getCachePath(SPEC, self.directory.name)
+        self.lexer.save(path)
+        with open(path) as file:
+            data = json.load(file)
+        changes = {
+            "version": lambda data: data.update(version=0),
+            "short table": lambda data: data["table"].pop(),
+            "q0": lambda data: data.update(q0=data["K"]),
+            "F": lambda data: data["F"].append(data["K"]),
+            "transition": lambda data: data["table"].__setitem__(0, data["K"]),
+            "token table": lambda data: data["token_table"].append([min(set(range(data["K"])) - set(data["F"])), "SPACE", 0]),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                bad = json.loads(json.dumps(data))
+                change(bad)
+                with open(path, "w") as file:
+                    json.dump(bad, file)
+                with self.assertRaises(ValueError):
+                    Lexer.load(path)
+                self.assertSameLexer(Lexer.from_cache(SPEC, self.directory.name))
+                self.assertSameLexer(Lexer.load(path))
@@ -0,0 +1,108 @@
+import unittest
+from src import Stats
+from src.Interpreter import SPEC
+from src.Lexer import CHUNK_SIZE, Lexer
+
+# the tokens (name, lexem) the first version of the lexer returned for each
+# input. a lexing error is a single ('', message) token
+BASELINE = [
+    ("( 1 2 3 )", [
+        ('L_PAR', '('), ('SPACE', ' '), ('NUMBER', '1'), ('SPACE', ' '), ('NUMBER', '2'),
+        ('SPACE', ' '), ('NUMBER', '3'), ('SPACE', ' '), ('R_PAR', ')'),
+    ]),
+    ("(+ ( 12 345 ) )", [
+        ('L_PAR', '('), ('SUM', '+'), ('SPACE', ' '), ('L_PAR', '('), ('SPACE', ' '), ('NUMBER', '12'),
+        ('SPACE', ' '), ('NUMBER', '345'), ('SPACE', ' '), ('R_PAR', ')'), ('SPACE', ' '), ('R_PAR', ')'),
+    ]),
+    ("(++ ( (1 2) (3) ) )", [
+        ('L_PAR', '('), ('APPEND', '++'), ('SPACE', ' '), ('L_PAR', '('), ('SPACE', ' '), ('L_PAR', '('),
+        ('NUMBER', '1'), ('SPACE', ' '), ('NUMBER', '2'), ('R_PAR', ')'), ('SPACE', ' '), ('L_PAR', '('),
+        ('NUMBER', '3'), ('R_PAR', ')'), ('SPACE', ' '), ('R_PAR', ')'), ('SPACE', ' '), ('R_PAR', ')'),
+    ]),
+    ("((lambda x: ( x x )) 4)", [
+        ('L_PAR', '('), ('L_PAR', '('), ('LAMBDA', 'lambda'), ('SPACE', ' '), ('VARIABLE', 'x'),
+        ('COLON', ':'), ('SPACE', ' '), ('L_PAR', '('), ('SPACE', ' '), ('VARIABLE', 'x'), ('SPACE', ' '),
+        ('VARIABLE', 'x'), ('SPACE', ' '), ('R_PAR', ')'), ('R_PAR', ')'), ('SPACE', ' '), ('NUMBER', '4'),
+        ('R_PAR', ')'),
+    ]),
+    ("lambdax lambda", [('VARIABLE', 'lambdax'), ('SPACE', ' '), ('LAMBDA', 'lambda')]),
+    ("abc+++9", [('VARIABLE', 'abc'), ('APPEND', '++'), ('SUM', '+'), ('NUMBER', '9')]),
+    ("( 1 # 2 )", [('', 'No viable alternative at character 5, line 0')]),
+    ("(y 1 A)", [('', 'No viable alternative at character 5, line 0')]),
+    ("( 1\n2 # )", [('', 'No viable alternative at character 0, line 1')]),
+    ("( 1\n2 3 A )", [('', 'No viable alternative at character 4, line 1')]),
+    ("1 2 #", [('', 'No viable alternative at character EOF, line 0')]),
+]
+
+
+class LexerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.lexers = {
+            "minimized": Lexer(SPEC),
+            "not minimized": Lexer(SPEC, minimize=False),
+            "lazy": Lexer(SPEC, lazy=True),
+        }
+
+    def test_baseline(self) -> None:
+        for kind, lexer in self.lexers.items():
+            for word, tokens in BASELINE:
+                with self.subTest(lexer=kind, word=word):
+                    self.assertEqual([(name, lexem) for name, lexem, _, _ in lexer.lex(word)], tokens)
+
+    # lexStream, reading the input in chunks, and lexTokens give the same
+    # tokens, which are those of lex if there is no error. lex first looks
+    # for letters that are not in the alphabet, so its errors can be at
+    # other positions
+    def test_stream_and_arrays(self) -> None:
+        lexer = self.lexers["minimized"]
+        for word, tokens in BASELINE:
+            with self.subTest(word=word):
+                stream = list(lexer.lexStream(word[i : i + 2] for i in range(0, len(word), 2)))
+                self.assertEqual(list(lexer.lexTokens(word)), stream)
+                if tokens[-1][0] != '':
+                    self.assertEqual(stream, lexer.lex(word))
+
+    # lexBlocks gives the tokens of lexTokens, in arrays of about CHUNK_SIZE
+    # characters, with the lexems cut by the chunks kept whole
+    def test_blocks(self) -> None:
+        lexer = self.lexers["minimized"]
+        text = "(++ ( " + "(12 lambda 345) " * (CHUNK_SIZE // 8) + ") )"
+        for word in [text, text + " A", text[:-2] + "#"]:
+            with self.subTest(end=word[-3:]):
+                blocks = list(lexer.lexBlocks(word[i : i + 1000] for i in range(0, len(word), 1000)))
+                self.assertGreater(len(blocks), 1)
+                self.assertEqual([token for block in blocks for token in block], list(lexer.lexTokens(word)))
+
+    # a lexem much longer than a chunk is walked a number of times that grows
+    # with the log of its length, not once for every chunk it spans
+    def test_long_lexem(self) -> None:
+        lexer = self.lexers["minimized"]
+        word = "( " + "1" * (CHUNK_SIZE * 8) + " )"
+        with Stats.record() as stats:
+            tokens = list(lexer.lexStream(word[i : i + 100] for i in range(0, len(word), 100)))
+        self.assertEqual(tokens, list(lexer.lexTokens(word)))
+        self.assertLess(stats.counters["dfa_walks"], 20)
+
+    # a lazy lexer with a cache of one or two states evicts states all the time
+    # and still gives the tokens of the dense one
+    def test_lazy_evictions(self) -> None:
+        words = [word for word, tokens in BASELINE if tokens[-1][0] != '']
+        for max_states in (1, 2):
+            with self.subTest(max_states=max_states):
+                lexer = Lexer(SPEC, lazy=True, max_states=max_states)
+                for word in words:
+                    self.assertEqual(lexer.lex(word), self.lexers["minimized"].lex(word))
+                stats = lexer.getCacheStats()
+                self.assertLessEqual(stats["states"], max_states)
+                self.assertGreater(stats["evictions"], 0)
+                self.assertGreater(stats["transition_misses"], 0)
+        self.assertIsNone(self.lexers["minimized"].getCacheStats())
+
+    def test_positions(self) -> None:
+        tokens = self.lexers["minimized"].lex("(+ ( 12 345 ) )")
+        self.assertEqual([(start, end) for _, _, start, end in tokens][4:8], [(4, 5), (5, 7), (7, 8), (8, 11)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import io
+import unittest
+from src.Interpreter import SPEC, evaluate
+from src.Lexer import CHUNK_SIZE, Lexer
+
+# programs and what the first version of the interpreter printed for them
+CASES = [
+    ("1", "1"),
+    ("( 1 2 3 )", "( 1 2 3 )"),
+    ("( )", "()"),
+    ("( ( ) )", "( () )"),
+    ("( 1 ( 2 ( 3 ) ) )", "( 1 ( 2 ( 3 ) ) )"),
+    ("(+ ( 1 2 3 ) )", "6"),
+    ("(+ (1 2 3))", "6"),
+    ("(+ ( 1 ( 2 3 ) ( ( 4 ) ) ) )", "10"),
+    ("(+ ( ) )", "0"),
+    ("(++ ( (1 2) (3) ) )", "( 1 2 3 )"),
+    ("(++ ( (1 2) ( ) (3) ) )", "( 1 2 3 )"),
+    ("(++ ( (1 ( ) 2) (3) ) )", "( 1 () 2 3 )"),
+    ("(++ ( 1 2 ) )", "( 1 2 )"),
+    ("(+ ( (++ ( (1 2) (3) ) ) 4 ) )", "10"),
+    ("((lambda x: x) 5)", "( 5 )"),
+    ("((lambda x: ( x x )) 4)", "( ( 4 4 ) )"),
+    ("((lambda x: (+ ( x 1 ) )) 2)", "( 3 )"),
+    ("((lambda x: ((lambda y: ( x y )) 2)) 1)", "( ( ( 1 2 ) ) )"),
+    ("((lambda x: (++ ( x x ) )) (1 2))", "( ( 1 2 1 2 ) )"),
+    ("(lambda x: x 7)", "7"),
+    ("(lambda x: ( x 1 ) 7)", "( 7 1 )"),
+    ("( 123456789012345678901234567890 1 )", "( 123456789012345678901234567890 1 )"),
+    ("(+ ( 99999999999999999999 1 ) )", "100000000000000000000"),
+    ("(+ (\n  1\n  2 ))", "3"),
+    ("(++ (\n  (1 2)\n  ( 3 ) ) )", "( 1 2 3 )"),
+    # a program starting with ')' or ':' has nothing to evaluate
+    (") 1", ""),
+    (": 1", ""),
+    # lexing errors print an empty line, even after an error of the program
+    ("( 1 # 2 )", ""),
+    ("(x #)", ""),
+    ("(y 1 A)", ""),
+]
+
+# programs whose output changed on purpose, with what the first version
+# printed for them
+DEVIATIONS = [
+    # the argument was taken from the leftmost path of the root, and so
+    # used twice: ( ( 5 5 ) ) and ( ( 11 11 ) )
+    ("((lambda x: x) ((lambda y: y) 5))", "( ( 5 ) )"),
+    ("(lambda x: ( x ) ((lambda z: z) 11))", "( ( 11 ) )"),
+    # the value of a function replaced the first child of the node around
+    # its bracket, whichever child the bracket was: ( 3 ) and ( ( 4 8 ) ).
+    # when the arguments were first shared, this made the first and the
+    # last of these programs never end
+    ("((lambda x: ( x x )) (+ (1 2)))", "( ( 3 3 ) )"),
+    ("(++ (lambda x: ( x ) 11) (++ ( 4 8 ) ) )", "( 11 )"),
+    ("(++ (lambda x: ( x ) ((lambda z: z) 11)) (++ ( 4 8 ) ) )", "( 11 )"),
+    # for the same reason, these never ended
+    ("(++ ( (1 2) (+ (3 4)) ) )", "( 1 2 7 )"),
+    ("(+ ( 1 (++ (2 3) (4)) ))", "6"),
+    # a function given as an argument could not be applied: IndexError
+    ("((lambda f: (f 3)) (lambda x: (+ ( x x ) )))", "( ( 6 ) )"),
+]
+
+
+def run(lexer: Lexer, program: str) -> str:
+    stream = io.StringIO()
+    evaluate(lexer, io.StringIO(program + "\n"), stream)
+    return stream.getvalue()
+
+
+class ProgramsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.lexer = Lexer(SPEC)
+
+    def test_baseline(self) -> None:
+        for program, result in CASES:
+            with self.subTest(program=program):
+                self.assertEqual(run(self.lexer, program), result)
+
+    def test_deviations(self) -> None:
+        for program, result in DEVIATIONS:
+            with self.subTest(program=program):
+                self.assertEqual(run(self.lexer, program), result)
+
+    # the error of the program is in the first arrays of tokens of the file,
+    # the lexing error in the last ones
+    def test_late_lexing_error(self) -> None:
+        program = "( x " + "1 " * CHUNK_SIZE + "# )"
+        self.assertEqual(run(self.lexer, program), "")
+        with self.assertRaises(KeyError):
+            run(self.lexer, program.replace("#", "2"))
+
+    # deep programs are walked without recursion
+    def test_depth(self) -> None:
+        depth = 10 ** 4
+        self.assertEqual(run(self.lexer, "(+ " + "( " * depth + "1 2" + " )" * depth + " )"), "3")
+        self.assertEqual(run(self.lexer, "((lambda x: " * depth + "x" + ") 5)" * depth), "( " * depth + "5" + " )" * depth)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from typing import TextIO
+from src.Interpreter import SPEC
+from src.Lexer import Lexer
+from src.Server import handle, isStaleSocket, respond, serve
+from src.Session import Sessions
+
+
+def echo(program: str, stream: TextIO, session: str | None) -> None:
+    if program == 'fail':
+        raise ValueError('failed')
+    stream.write(program.upper())
+
+
+# answers the lines of requests with handle and returns the responses and
+# the lines of the log
+def answer(evaluate, *lines: bytes) -> tuple[list[dict], list[str]]:
+    rfile = io.BytesIO(b''.join(line + b'\n' for line in lines))
+    wfile = io.BytesIO()
+    log = io.StringIO()
+    handle(rfile, wfile, evaluate, log, threading.Lock())
+    return [json.loads(line) for line in wfile.getvalue().splitlines()], log.getvalue().splitlines()
+
+
+class ServerTest(unittest.TestCase):
+    def test_respond(self) -> None:
+        response = respond({'program': 'abc', 'id': 7}, echo)
+        self.assertEqual((response['result'], response['error'], response['id']), ('ABC', None, 7))
+        response = respond({'program': 'fail'}, echo)
+        self.assertEqual((response['result'], response['error']), (None, 'ValueError: failed'))
+        self.assertNotIn('id', response)
+
+    def test_handle(self) -> None:
+        responses, log = answer(echo, b'{"program": "a", "id": "first"}', b'', b'{"program": ', b'{"id": 3}', b'{"program": "b"}')
+        self.assertEqual(len(log), 4)
+        self.assertTrue(log[0].startswith('request first: ') and log[2].endswith(' (error)'))
+        self.assertEqual([response.get('id') for response in responses], ['first', None, 3, None])
+        self.assertEqual([response['result'] for response in responses], ['A', None, None, 'B'])
+        self.assertTrue(responses[1]['error'].startswith('bad request: '))
+        self.assertEqual(responses[2]['error'], "KeyError: 'program'")
+
+    # the requests of a session are evaluated in order, each one from the last one
+    def test_sessions(self) -> None:
+        sessions = Sessions(Lexer(SPEC))
+        requests = [
+            {'program': '(+ ( 1 2 ) )', 'session': 's', 'id': 1},
+            {'program': '(+ ( 1 2 3 ) )', 'session': 's', 'id': 2},
+            {'program': '(+ ( 1 2 3 ) )', 'id': 3},
+            {'program': '(++ ( (1) 2 3 ) )', 'session': 's', 'id': 4},
+        ]
+        responses, _ = answer(sessions.evaluate, *(json.dumps(request).encode() for request in requests))
+        self.assertEqual([(response['id'], response['result'], response['error']) for response in responses],
+                         [(1, '3', None), (2, '6', None), (3, '6', None), (4, '( 1 2 3 )', None)])
+
+    # the least recently used session is dropped for a new one, and its next
+    # program is evaluated from scratch
+    def test_evicted_sessions(self) -> None:
+        sessions = Sessions(Lexer(SPEC), max_sessions=2)
+        for key, program in [('a', '( 1 )'), ('b', '( 2 )'), ('a', '( 1 3 )'), ('c', '( 4 )'), ('b', '( 2 5 )')]:
+            stream = io.StringIO()
+            sessions.evaluate(program, stream, key)
+            self.assertEqual(stream.getvalue(), program)
+        self.assertEqual(list(sessions.sessions), ['c', 'b'])
+        self.assertEqual(sessions.evictions, 2)
+        with self.assertRaises(ValueError):
+            Sessions(Lexer(SPEC), max_sessions=0)
+
+    # only a socket that no server listens on is replaced
+    def test_stale_socket(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            address = os.path.join(directory, 'socket')
+            with open(address, 'w') as file:
+                file.write('not a socket')
+            self.assertFalse(isStaleSocket(address))
+            with self.assertRaises(SystemExit):
+                serve(address, echo)
+            with open(address) as file:
+                self.assertEqual(file.read(), 'not a socket')
+            os.unlink(address)
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(address)
+                server.listen()
+                self.assertFalse(isStaleSocket(address))
+                with self.assertRaises(SystemExit):
+                    serve(address, echo)
+            self.assertTrue(os.path.exists(address))
+            self.assertTrue(isStaleSocket(address))
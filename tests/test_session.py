@@ -0,0 +1,127 @@
+import bisect
+import io
+import random
+import re
+import unittest
+from array import array
+from unittest import mock
+from src import Stats
+from src.Interpreter import SPEC, evaluate
+from src.Lexer import Lexer
+from src.Session import Positions, Session
+
+
+# a random program of the given depth. lambdas is the probability of a
+# bracket being a lambda function
+def program(rng: random.Random, depth: int, bound: list[str], lambdas: float) -> str:
+    r = rng.random()
+    if depth <= 0 or r < 0.25:
+        if bound and rng.random() < 0.5:
+            return rng.choice(bound)
+        return str(rng.randint(0, 99))
+    if r < 0.35:
+        return '(+ ( ' + ' '.join(program(rng, depth - 1, bound, lambdas) for _ in range(rng.randint(1, 3))) + ' ) )'
+    if r < 0.45:
+        return '(++ ( ' + ' '.join(program(rng, depth - 1, bound, lambdas) for _ in range(rng.randint(1, 3))) + ' ) )'
+    if rng.random() > lambdas:
+        return '( ' + ' '.join(program(rng, depth - 1, bound, lambdas) for _ in range(rng.randint(0, 4))) + ' )'
+    name = rng.choice('xyz')
+    body = program(rng, depth - 1, bound + [name], lambdas)
+    return f'((lambda {name}: {body}) {program(rng, depth - 1, bound, lambdas)})'
+
+
+# a random edit of text: a number changed or removed, a program inserted
+# after a space, a bracket of numbers removed or a few characters changed
+def edit(rng: random.Random, text: str) -> str:
+    numbers = [match.span() for match in re.finditer(r'\d+', text)]
+    brackets = [match.span() for match in re.finditer(r'\( [^()]*\)', text)]
+    spaces = [k for k, char in enumerate(text) if char == ' ']
+    r = rng.random()
+    if r < 0.3 and numbers:
+        i, j = rng.choice(numbers)
+        return text[:i] + str(rng.randint(0, 999)) + text[j:]
+    if r < 0.5 and spaces:
+        k = rng.choice(spaces) + 1
+        return text[:k] + program(rng, 3, [], 0) + ' ' + text[k:]
+    if r < 0.6 and brackets:
+        i, j = rng.choice(brackets)
+        return text[:i] + text[j:]
+    if r < 0.7 and numbers:
+        i, j = rng.choice(numbers)
+        return text[:i] + text[j:]
+    i = rng.randint(0, len(text))
+    j = min(len(text), i + rng.randint(0, 3))
+    return text[:i] + rng.choice(['(', ')', ' ', '7', '++', '+', 'x', '\n', '( 4 5 )', '#']) + text[j:]
+
+
+class SessionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.lexer = Lexer(SPEC)
+
+    # the result of a program, or the type of the error it raises
+    def result(self, text: str) -> str:
+        try:
+            stream = io.StringIO()
+            evaluate(self.lexer, io.StringIO(text), stream)
+            return stream.getvalue()
+        except Exception as error:
+            return type(error).__name__
+
+    def update(self, session: Session, text: str) -> str:
+        try:
+            return session.update(text)
+        except Exception as error:
+            return type(error).__name__
+
+    # every version of an edited program gives what it gives when it is
+    # evaluated alone
+    def test_random_edits(self) -> None:
+        rng = random.Random(0)
+        for _ in range(60):
+            text = '( ' + program(rng, 5, [], rng.choice([0, 0, 0.2])) + ' )'
+            session = Session(self.lexer)
+            for _ in range(20):
+                text = edit(rng, text)
+                with self.subTest(text=text):
+                    self.assertEqual(self.update(session, text), self.result(text))
+
+    # an edit of one bracket among many puts its output in the result
+    # instead of evaluating the whole program again
+    def test_spliced_results(self) -> None:
+        parts = ['(+ ( %d 1 ) )' % i for i in range(100)] + ['( %d ( 2 ) )' % i for i in range(100)]
+        session = Session(self.lexer)
+        session.update('( ' + ' '.join(parts) + ' )')
+        rng = random.Random(1)
+        with Stats.record() as stats:
+            for k in range(20):
+                i = rng.randrange(len(parts))
+                parts[i] = parts[i].replace('( ', '( %d ' % k, 1)
+                text = '( ' + ' '.join(parts) + ' )'
+                self.assertEqual(session.update(text), self.result(text))
+        self.assertEqual(stats.counters["spliced_results"], 20)
+        self.assertNotIn("session_rebuilds", stats.counters)
+
+    # the positions in small blocks match those of a list after random splices
+    def test_positions(self) -> None:
+        rng = random.Random(2)
+        with mock.patch('src.Session.POSITIONS_BLOCK', 4):
+            for _ in range(100):
+                expected = sorted(rng.sample(range(1000), rng.randint(0, 30)))
+                positions = Positions(array('q', expected))
+                for _ in range(20):
+                    a = rng.randint(0, len(expected))
+                    b = rng.randint(a, len(expected))
+                    low = expected[a - 1] + 1 if a else 0
+                    new = sorted(rng.sample(range(low, low + 100), rng.randint(0, 10)))
+                    shift = (new[-1] if new else low) + 100 - (expected[b] if b < len(expected) else 0)
+                    expected[a:] = new + [position + shift for position in expected[b:]]
+                    positions.splice(a, b, array('q', new), shift)
+                    self.assertEqual(list(positions.slice(0, len(positions))), expected)
+                    for position in rng.sample(range(-1, expected[-1] + 2 if expected else 1), min(5, len(expected) + 1)):
+                        self.assertEqual(positions.bisectLeft(position), bisect.bisect_left(expected, position))
+                        self.assertEqual(positions.bisectRight(position, a), bisect.bisect_right(expected, position, a))
+
+
+if __name__ == '__main__':
+    unittest.main()